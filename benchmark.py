@@ -0,0 +1,310 @@
+"""
+Benchmark suite for json-builder.py.
+
+Generates synthetic items.csv / options.csv / images.csv at the requested
+scales, then runs main() on each data set in a fresh child process and
+reports per-stage timings, throughput, end-to-end wall time and peak
+memory as JSON, so results from different releases can be compared.
+
+    python benchmark.py --rows 10000 100000 1000000 --out bench.json
+    python benchmark.py --rows 50000 --categories 200 --subcats 5 --options-per-sku 4 --images-per-sku 3
+    python benchmark.py --rows 1000000 --strip-images
+    python benchmark.py --ids 1000000
+
+Generated data sets are cached in --workdir (keyed on their parameters),
+so repeated runs only pay for the build itself. --strip-images also times
+remove_images_in_json_file() on each build's output, in its own child
+process so its peak memory is measured apart from the build's. --ids only
+times ID generation: IdGenerator against the generator it replaced.
+"""
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BUILDER_PATH = os.path.join(HERE, "json-builder.py")
+
+SIZES = ["S", "M", "L", "XL", "XXL", "36", "38", "40", "42", "44"]
+
+def load_json_builder():
+    """Imports json-builder.py (not importable by name because of the dash)."""
+    spec = importlib.util.spec_from_file_location("json_builder", BUILDER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["json_builder"] = module
+    spec.loader.exec_module(module)
+    return module
+
+def generate_items_csv(path, rows, categories=20, subcats=3, seed=1):
+    """
+    Writes items.csv with 'rows' items spread over 'categories' main categories,
+    each with 'subcats' subcategories (0 => none). A quarter of the rows have
+    no sub_cat, so Misc subcategories are exercised as well.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["merchant_sku", "name", "price", "cat_name", "sub_cat", "description",
+                         "enabled", "delivery_methods", "brand_id", "more_information", "producer_information"])
+        for i in range(rows):
+            cat = rng.randrange(categories)
+            sub_cat = ""
+            if subcats and rng.random() >= 0.25:
+                sub_cat = f"Υποκατηγορία {cat}-{rng.randrange(subcats)}"
+            writer.writerow([
+                f"SKU{i}",
+                f"Προϊόν {i}",
+                f"{rng.randrange(50, 20000) / 100:.2f}",
+                f"Κατηγορία {cat}",
+                sub_cat,
+                rng.choice(["", "Περιγραφή προϊόντος", f"Περιγραφή {i % 100}"]),
+                rng.choice(["", "YES", "NO"]),
+                rng.choice(["", "takeaway, homedelivery"]),
+                rng.choice(["", "brand1", "brand2"]),
+                rng.choice(["", "Περισσότερες πληροφορίες"]),
+                rng.choice(["", "Παραγωγός Α.Ε."]),
+            ])
+
+def generate_options_csv(path, rows, options_per_sku=3, option_sku_ratio=0.3, seed=2):
+    """Writes options.csv: a size group with 'options_per_sku' values for that share of the SKUs."""
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["merchant_sku", "dis_name", "opt_name", "price_markup", "ext_id"])
+        for i in range(rows):
+            if options_per_sku and rng.random() < option_sku_ratio:
+                for size in SIZES[:options_per_sku]:
+                    writer.writerow([f"SKU{i}", "", size, rng.choice(["", "0", "50"]), ""])
+
+def generate_images_csv(path, rows, images_per_sku=2, seed=3):
+    """Writes images.csv with 'images_per_sku' image urls for every SKU."""
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["merchant_sku", "image_url"])
+        for i in range(rows):
+            for k in range(images_per_sku):
+                writer.writerow([f"SKU{i}", f"https://img.example.com/{i}/{k}-{rng.randrange(10 ** 6)}.jpg"])
+
+def ensure_dataset(workdir, rows, categories, subcats, options_per_sku, option_sku_ratio, images_per_sku):
+    """Generates (or reuses) a synthetic data set; returns its directory."""
+    name = f"rows{rows}_c{categories}_s{subcats}_o{options_per_sku}x{option_sku_ratio}_i{images_per_sku}"
+    data_dir = os.path.join(workdir, name)
+    done_marker = os.path.join(data_dir, ".complete")
+    if not os.path.exists(done_marker):
+        os.makedirs(data_dir, exist_ok=True)
+        generate_items_csv(os.path.join(data_dir, "items.csv"), rows, categories, subcats)
+        generate_options_csv(os.path.join(data_dir, "options.csv"), rows, options_per_sku, option_sku_ratio)
+        generate_images_csv(os.path.join(data_dir, "images.csv"), rows, images_per_sku)
+        open(done_marker, "w").close()
+    return data_dir
+
+def _peak_rss_mb():
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _run_child(data_dir, output_format, trace_memory, workers, dedup_options=False, json_backend="auto"):
+    """Runs one build in this process and returns its measurements (called in the child)."""
+    import logging
+    logging.basicConfig(level=logging.ERROR)
+    builder = load_json_builder()
+
+    output_json = os.path.join(data_dir, "bench_output.json")
+    profile_json = os.path.join(data_dir, "bench_profile.json")
+    start = time.perf_counter()
+    stats = builder.main(
+        os.path.join(data_dir, "items.csv"),
+        os.path.join(data_dir, "options.csv"),
+        os.path.join(data_dir, "images.csv"),
+        output_json,
+        id_seed=1,
+        output_format=output_format,
+        json_backend=json_backend,
+        workers=workers,
+        dedup_options=dedup_options,
+        profile=True if trace_memory else "time",
+        profile_json=profile_json,
+    )
+    wall = time.perf_counter() - start
+
+    with open(profile_json, encoding="utf-8") as f:
+        profile = json.load(f)
+    for stage in profile["stages"]:
+        if stage["count"] and stage["wall_s"]:
+            stage["per_s"] = round(stage["count"] / stage["wall_s"], 1)
+
+    output_bytes = 0
+    if output_format == "ndjson":
+        for path in builder.ndjson_output_paths(output_json).values():
+            output_bytes += os.path.getsize(path)
+    else:
+        output_bytes = os.path.getsize(output_json)
+
+    result = {
+        "end_to_end_wall_s": round(wall, 4),
+        "items": stats["items"],
+        "options": stats["options"],
+        "items_per_s": round(stats["items"] / wall, 1) if wall else None,
+        "output_bytes": output_bytes,
+        "stages": profile["stages"],
+    }
+    if resource is not None:
+        result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+def _run_strip_child(data_dir, stream):
+    """Strips the images from the last build's output in this process and returns its measurements."""
+    import logging
+    logging.basicConfig(level=logging.ERROR)
+    builder = load_json_builder()
+
+    input_json = os.path.join(data_dir, "bench_output.json")
+    start = time.perf_counter()
+    builder.remove_images_in_json_file(input_json, os.path.join(data_dir, "bench_no_images.json"), stream=stream)
+    result = {
+        "strip_images_stream": stream,
+        "strip_images_wall_s": round(time.perf_counter() - start, 4),
+        "strip_images_input_bytes": os.path.getsize(input_json),
+    }
+    if resource is not None:
+        result["strip_images_peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+def legacy_random_id(generated_ids):
+    """The generate_random_id() IdGenerator replaced: one random.choice() per hex digit."""
+    hex_chars = "0123456789abcdef"
+    while True:
+        new_id = "ID" + "".join(random.choice(hex_chars) for _ in range(23))
+        if new_id not in generated_ids:
+            generated_ids.add(new_id)
+            return new_id
+
+def run_id_benchmark(count):
+    """Times 'count' IDs from the legacy generator and from IdGenerator in every tracking mode."""
+    builder = load_json_builder()
+    legacy_ids = set()
+    generators = {"legacy": lambda: legacy_random_id(legacy_ids)}
+    for tracking in builder.ID_TRACKING_MODES:
+        generators[tracking] = builder.IdGenerator(seed=1, tracking=tracking)
+    report = {"python": platform.python_version(), "ids": count, "ids_per_s": {}}
+    for name, generator in generators.items():
+        start = time.perf_counter()
+        for _ in range(count):
+            generator()
+        report["ids_per_s"][name] = round(count / (time.perf_counter() - start), 1)
+        print(f"{name:>8} {report['ids_per_s'][name]:>12} IDs/s", file=sys.stderr)
+    report["speedup"] = {name: round(rate / report["ids_per_s"]["legacy"], 1)
+                         for name, rate in report["ids_per_s"].items() if name != "legacy"}
+    return report
+
+def run_benchmarks(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "output_format": args.output_format,
+        "json_backend": args.json_backend,
+        "workers": args.workers,
+        "dedup_options": args.dedup_options,
+        "trace_memory": args.trace_memory,
+        "strip_images": args.strip_images,
+        "runs": [],
+    }
+    for rows in args.rows:
+        data_dir = ensure_dataset(args.workdir, rows, args.categories, args.subcats,
+                                  args.options_per_sku, args.option_sku_ratio, args.images_per_sku)
+        for repeat in range(args.repeat):
+            # a fresh interpreter per run keeps peak RSS and ID state isolated
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", data_dir,
+                   "--output-format", args.output_format, "--json-backend", args.json_backend]
+            if args.trace_memory:
+                cmd.append("--trace-memory")
+            if args.workers:
+                cmd += ["--workers", str(args.workers)]
+            if args.dedup_options:
+                cmd.append("--dedup-options")
+            out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            if args.strip_images and args.output_format != "ndjson":
+                cmd = [sys.executable, os.path.abspath(__file__), "--child", data_dir, "--strip-images"]
+                if args.strip_images == "load":
+                    cmd.append("--strip-load")
+                out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+                result.update(json.loads(out.strip().splitlines()[-1]))
+            result.update({
+                "rows": rows,
+                "repeat": repeat,
+                "categories": args.categories,
+                "subcats": args.subcats,
+                "options_per_sku": args.options_per_sku,
+                "option_sku_ratio": args.option_sku_ratio,
+                "images_per_sku": args.images_per_sku,
+            })
+            report["runs"].append(result)
+            print(f"rows={rows:>9} run={repeat} wall={result['end_to_end_wall_s']:.2f}s "
+                  f"items/s={result['items_per_s']} peak_rss={result.get('peak_rss_mb', '-')}MB",
+                  file=sys.stderr)
+            if "strip_images_wall_s" in result:
+                print(f"{'':>15} strip_images wall={result['strip_images_wall_s']:.2f}s "
+                      f"peak_rss={result.get('strip_images_peak_rss_mb', '-')}MB", file=sys.stderr)
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark json-builder.py on synthetic CSV feeds.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000],
+                        help="items.csv sizes to benchmark (e.g. 10000 100000 1000000 5000000)")
+    parser.add_argument("--categories", type=int, default=20, help="number of main categories")
+    parser.add_argument("--subcats", type=int, default=3, help="subcategories per main category (0 = none)")
+    parser.add_argument("--options-per-sku", type=int, default=3, help="option values per option group")
+    parser.add_argument("--option-sku-ratio", type=float, default=0.3, help="share of SKUs that have options")
+    parser.add_argument("--images-per-sku", type=int, default=2, help="images.csv rows per SKU")
+    parser.add_argument("--output-format", default="json", help="json, compact or ndjson")
+    parser.add_argument("--json-backend", default="auto", choices=["auto", "orjson", "stdlib"],
+                        help="main()'s encoder for the compact and ndjson formats")
+    parser.add_argument("--workers", type=int, default=None, help="build items in N processes")
+    parser.add_argument("--dedup-options", action="store_true",
+                        help="build with main(dedup_options=True): one option doc per distinct option group")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record tracemalloc peaks per stage (much slower)")
+    parser.add_argument("--strip-images", nargs="?", const="stream", choices=["stream", "load"],
+                        help="also time remove_images_in_json_file() on the output "
+                             "(streaming by default, 'load' for the json.load path)")
+    parser.add_argument("--strip-load", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scale")
+    parser.add_argument("--workdir", default=os.path.join(HERE, "bench_data"),
+                        help="where generated data sets are cached")
+    parser.add_argument("--ids", type=int, metavar="N",
+                        help="only time generating N IDs, IdGenerator against the legacy generator")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child and args.strip_images:
+        print(json.dumps(_run_strip_child(args.child, stream=not args.strip_load)))
+        sys.exit(0)
+    if args.child:
+        print(json.dumps(_run_child(args.child, args.output_format, args.trace_memory, args.workers,
+                                    args.dedup_options, args.json_backend)))
+        sys.exit(0)
+
+    report = run_id_benchmark(args.ids) if args.ids else run_benchmarks(args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
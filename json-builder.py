@@ -1,12 +1,53 @@
+import argparse
 import csv
+import hashlib
 import json
 from bson import ObjectId
 from collections import defaultdict
 import random
 import os
-
-# tracking already generated IDs within this script execution
-generated_ids = set()
+import re
+import sys
+import logging
+import time
+import tracemalloc
+from array import array
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice, repeat
+
+logger = logging.getLogger("json_builder")
+
+# warnings and errors reported so far, for main()'s build summary: counted
+# where they are reported, so the totals do not depend on the log level
+_issue_counts = Counter()
+
+def _log_warning(msg, *args):
+    """logger.warning() that is also counted in _issue_counts."""
+    _issue_counts["warnings"] += 1
+    logger.warning(msg, *args)
+
+def _log_error(msg, *args):
+    """logger.error() that is also counted in _issue_counts."""
+    _issue_counts["errors"] += 1
+    logger.error(msg, *args)
+
+try:
+    import orjson  # optional, faster compact encoder
+except ImportError:
+    orjson = None
+
+try:
+    import ijson  # optional, event-based parser for reading large outputs back
+except ImportError:
+    ijson = None
+
+try:
+    import numpy as np  # optional, batch price conversion in read_items_csv()
+except ImportError:
+    np = None
 
 def custom_json_encoder(obj):
     """Convert ObjectIds to strings for JSON output."""
@@ -14,20 +55,794 @@ def custom_json_encoder(obj):
         return str(obj)
     return obj
 
-# assuming you have a global set and generate_random_id function:
-generated_ids = set()
+class CompactIdSet:
+    """
+    Set of 'ID' + 23 hex IDs stored as packed 92-bit integers.
+    Open addressing (linear probing) over two flat arrays: the low 64 bits
+    in an array('Q') and the high 28 bits, tagged with an "occupied" bit,
+    in an array('I'). That is 12 bytes per slot, roughly 16-32 bytes per
+    ID, instead of a full str object plus a set entry per ID.
+    """
+
+    _OCCUPIED = 0x80000000
+    _MAX_LOAD = 0.7
+
+    def __init__(self, capacity=1 << 16):
+        self._size = 0
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        self._mask = capacity - 1
+        self._limit = int(capacity * self._MAX_LOAD)
+        self._hi = array('I', bytes(4 * capacity))
+        self._lo = array('Q', bytes(8 * capacity))
+
+    def _grow(self):
+        old_hi, old_lo = self._hi, self._lo
+        self._alloc(2 * len(old_hi))
+        hi_arr, lo_arr, mask = self._hi, self._lo, self._mask
+        for tag, lo in zip(old_hi, old_lo):
+            if tag:
+                slot = lo & mask
+                while hi_arr[slot]:
+                    slot = (slot + 1) & mask
+                hi_arr[slot] = tag
+                lo_arr[slot] = lo
+
+    def _find(self, new_id):
+        # returns (slot, tag, lo, found)
+        value = int(new_id[2:], 16)
+        tag = (value >> 64) | self._OCCUPIED
+        lo = value & 0xFFFFFFFFFFFFFFFF
+        hi_arr, lo_arr, mask = self._hi, self._lo, self._mask
+        slot = lo & mask
+        while True:
+            t = hi_arr[slot]
+            if not t:
+                return slot, tag, lo, False
+            if t == tag and lo_arr[slot] == lo:
+                return slot, tag, lo, True
+            slot = (slot + 1) & mask
+
+    def add(self, new_id):
+        """Adds new_id; returns True if it was not already in the set."""
+        slot, tag, lo, found = self._find(new_id)
+        if found:
+            return False
+        self._hi[slot] = tag
+        self._lo[slot] = lo
+        self._size += 1
+        if self._size > self._limit:
+            self._grow()
+        return True
+
+    def __contains__(self, new_id):
+        return self._find(new_id)[3]
+
+    def __len__(self):
+        return self._size
+
+    def memory_bytes(self):
+        """Bytes held by the two backing arrays."""
+        return self._hi.buffer_info()[1] * self._hi.itemsize + self._lo.buffer_info()[1] * self._lo.itemsize
+
+# how IdGenerator checks for collisions:
+#   "compact" => CompactIdSet (default)
+#   "set"     => plain Python set of the ID strings
+#   "none"    => no tracking, rely on 92 random bits (~1e-16 collision odds at 1M IDs)
+ID_TRACKING_MODES = ("compact", "set", "none")
+
+class IdGenerator:
+    """
+    Hands out 'ID' + 23 hex char IDs (92 random bits) from a pre-sliced pool.
+    Random bytes are pulled in bulk (batch_size IDs at a time) instead of
+    one random.choice() call per character, which made ID creation the
+    hottest spot of a build.
+
+    With seed=None the bytes come from os.urandom. With an integer seed they
+    come from a private random.Random(seed), so the same seed and the same
+    input produce the same IDs on every run.
+
+    Every generator keeps its own record of issued IDs (see
+    ID_TRACKING_MODES), so uniqueness bookkeeping lives as long as one
+    build instead of the whole process.
+    """
+
+    def __init__(self, seed=None, batch_size=4096, tracking="compact"):
+        if seed is None:
+            self._random_bytes = os.urandom
+        else:
+            self._random_bytes = random.Random(seed).randbytes
+        self.batch_size = batch_size
+        self._pool = iter(())
+
+        if tracking == "compact":
+            self.generated_ids = CompactIdSet()
+            self._track = self.generated_ids.add
+        elif tracking == "set":
+            self.generated_ids = set()
+            self._track = self._track_in_set
+        elif tracking == "none":
+            self.generated_ids = None
+            self._track = None
+        else:
+            raise ValueError(f"ERROR: unknown ID tracking mode '{tracking}'. Use one of {ID_TRACKING_MODES}.")
+
+    def _track_in_set(self, new_id):
+        if new_id in self.generated_ids:
+            return False
+        self.generated_ids.add(new_id)
+        return True
+
+    def _refill(self):
+        # 12 bytes => 24 hex chars per ID; the first char is dropped to keep 23
+        hex_str = self._random_bytes(12 * self.batch_size).hex()
+        self._pool = iter(["ID" + hex_str[i + 1:i + 24] for i in range(0, len(hex_str), 24)])
+
+    def __call__(self, key=None):
+        # 'key' (see generate_random_id) is ignored: every call gets a new random ID
+        track = self._track
+        while True:
+            new_id = next(self._pool, None)
+            if new_id is None:
+                self._refill()
+                continue
+            if track is None or track(new_id):  # ensuring that it is unique
+                return new_id
+
+class HashIdGenerator:
+    """
+    Derives 'ID' + 23 hex char IDs from a keyed BLAKE2b hash of the business
+    key passed to generate_random_id() (catalog, cat/sub_cat names,
+    merchant_sku, dis_name, opt_name, ...), so the same input always gives
+    the same IDs and outputs can be diffed and cached. 'namespace' (e.g. the
+    catalog/venue name) separates catalogs built from overlapping data;
+    'secret' keys the hash so IDs cannot be recomputed from the CSVs alone.
+
+    No record of issued IDs is kept: distinct keys collide with the same
+    odds as two random 92-bit IDs. Only the key kinds that can repeat in a
+    build (_REPEATING_KINDS: option values named alike within one group,
+    and unkeyed calls) are counted; their repeats get an occurrence number
+    appended, so unkeyed calls are numbered in call order. Every other key
+    is unique by construction (item keys come from item_row_keys).
+    """
+
+    _track = None  # nothing to track, see ManifestIdGenerator
+    _REPEATING_KINDS = frozenset(("option_value", "option_group_value", "unkeyed"))
+
+    def __init__(self, namespace="", secret=None):
+        if isinstance(secret, str):
+            secret = secret.encode("utf-8")
+        self._hasher = hashlib.blake2b(key=secret or b"", digest_size=12)
+        self._hasher.update(namespace.encode("utf-8") + b"\x1e")
+        self._occurrences = Counter()
+
+    def __call__(self, key=None):
+        if key is None:
+            key = ("unkeyed",)
+        occurrence = 0
+        if key[0] in self._REPEATING_KINDS:
+            occurrence = self._occurrences[key]
+            self._occurrences[key] += 1
+        h = self._hasher.copy()
+        h.update("\x1f".join(key).encode("utf-8"))
+        if occurrence:
+            h.update(f"\x1f#{occurrence}".encode("utf-8"))
+        # same layout as IdGenerator: 24 hex chars, the first one dropped
+        return "ID" + h.hexdigest()[1:]
+
+# "random" => IdGenerator (optionally seeded), "hash" => HashIdGenerator
+ID_MODES = ("random", "hash")
+
+# the active generator; swap it with set_id_generator()
+_id_generator = IdGenerator()
+
+def set_id_generator(generator):
+    """
+    Plugs in the ID generator used by generate_random_id().
+    'generator' is any callable taking an optional key and returning a
+    unique ID string, e.g. IdGenerator(seed=42) for reproducible output.
+    Returns the previously active generator so callers can restore it.
+    """
+    global _id_generator
+    previous = _id_generator
+    _id_generator = generator
+    return previous
+
+def generate_random_id(key=None):
+    """
+    Returns a new unique ID from the active generator.
+    'key' is an optional tuple naming what the ID is for, built from
+    business keys (e.g. ("item", row_key) or ("category", cat, sub_cat));
+    keyed generators such as ManifestIdGenerator use it to hand out the same
+    ID for the same entity across builds.
+    """
+    return _id_generator(key)
+
+class ManifestIdGenerator:
+    """
+    Reuses the IDs a previous build issued for the same keys (loaded from a
+    build manifest, see load_manifest) and falls back to 'fallback' (an
+    IdGenerator or HashIdGenerator, called with the same key) for new keys
+    and for unkeyed calls. Keys seen more than once
+    in a build get an occurrence number appended, so duplicates still get
+    distinct, stable IDs. 'issued' collects key -> ID for the next manifest.
+    """
+
+    def __init__(self, previous_ids=None, fallback=None):
+        self.previous_ids = previous_ids or {}
+        self.fallback = fallback or IdGenerator()
+        self.issued = {}
+        self.reused = 0
+        self._occurrences = Counter()
+
+    def __call__(self, key=None):
+        if key is None:
+            return self.fallback(key)
+        occurrence = self._occurrences[key]
+        self._occurrences[key] += 1
+        # keys are tuples of strings; the unit separator cannot occur in CSV values
+        key_str = "\x1f".join(key)
+        if occurrence:
+            key_str = f"{key_str}\x1f#{occurrence}"
+
+        new_id = self.previous_ids.get(key_str)
+        track = self.fallback._track
+        if new_id is not None and (track is None or track(new_id)):
+            self.reused += 1
+        else:
+            new_id = self.fallback(key)
+        self.issued[key_str] = new_id
+        return new_id
+
+# Document templates. Per-row docs start as a shallow copy of a template and
+# only the per-row fields are assigned, so the values left in place are shared
+# by every doc and must be immutable: empty arrays are () (serialized as []
+# by both JSON backends), and dicts such as the author block are copied into
+# each doc.
+
+_AUTHOR = {
+    "id": "60a28b421f64e098f8e21493",
+    "kind": "user"
+}
+_CREATED_AT = {"$date": 1739358269656}
+
+# keys in output order; None marks fields filled per row
+_ITEM_TEMPLATE = {
+    "$oid": None,
+    "additives": (),
+    "alcohol_percentage": 0,
+    "allergens": (),
+    "baseprice": None,
+    "color": (),
+    "conditions_of_use_and_storage": (),
+    "country": (),
+    "courier_restrictions": (),
+    "delivery_methods": (),
+    "description": (),
+    "dietary_preferences": (),
+    "unit_type": "single_unit",
+    "number_of_units": 1,
+    "distributor_information": (),
+    "enabled": None,  # default = True
+    "external_id": None,
+    "image": None,
+    "image_blur": None,
+    "images": None,
+    "ingredients": (),
+    "is_bundle_offer": False,
+    "is_over_the_counter": False,
+    "mandatory_warnings": (),
+    "cata_id": None,
+    "merchant_sku": None,
+    "more_information": (),
+    "name": None,
+    "nutrition_facts": (),
+    "nutrition_values": (),
+    "offering_platform_metadata": None,
+    "options": None,
+    "producer_information": (),  # default empty
+    "regulatory_information": (),
+    "size": (),
+    "user_requirements": (),
+    "v": None
+}
+
+_OPTION_TEMPLATE = {
+    "$oid": None,
+    "default_value": None,
+    "......": (),
+    "cata_id": None,
+    "name": None,
+    "type": "choice",
+    "v": None,
+    "values": None
+}
+
+_OPTION_VALUE_TEMPLATE = {
+    "id": None,
+    "......": (),
+    "conditions_of_use_and_storage": (),
+    "country": (),
+    "dietary_preferences": (),
+    "distributor_information": (),
+    "ingredients": (),
+    "mandatory_warnings": (),
+    "name": None,
+    "nutrition_facts": (),
+    "producer_information": (),
+    "regulatory_information": ()
+}
+
+_MAIN_CATEGORY_TEMPLATE = {
+    "child_category_ids": None,
+    "description": (),
+    "id": None,
+    "image": "",
+    "image_blur": "",
+    "items": None,
+    "local": None,
+    "name": None
+}
+
+_SUB_CATEGORY_TEMPLATE = {
+    "child_category_ids": None,
+    "description": (),
+    "id": None,
+    "image": "",
+    "image_blur": "",
+    "......": (),
+    "items": None,
+    "local": None,
+    "name": None,
+    "parent_category_id": None
+}
+
+_MISC_CATEGORY_TEMPLATE = {
+    "child_category_ids": None,
+    "......": (),
+    "id": None,
+    "image": "",
+    "image_blur": "",
+    "items": None,
+    "local": None,
+    "name": None,
+    "parent_category_id": None
+}
+
+# the language of the unsuffixed CSV columns (name, description, ...)
+PRIMARY_LANGUAGE = "el"
+
+# <field>_<lang> columns, e.g. name_en, description_de, opt_name_pt-BR
+_LANG_SUFFIX = re.compile(r"[a-z]{2}(?:-[A-Z]{2})?")
+# suffixes that look like a language but name ordinary columns (<field>_id);
+# Indonesian needs a region, e.g. name_id-ID
+_NOT_LANG_SUFFIXES = frozenset(("id",))
+
+def localized_columns(fieldnames, fields):
+    """
+    Detects the language-suffixed columns of 'fields' in a CSV header, once
+    per file: returns {field: ((lang, column), ...)} for every field that
+    has any, languages in header order. The unsuffixed column stays the
+    PRIMARY_LANGUAGE value (a <field>_el column is ignored), and
+    <field>_id is an ID column, not Indonesian.
+    """
+    plan = {}
+    for column in fieldnames or ():
+        field, sep, lang = column.rpartition("_")
+        if (sep and field in fields and lang != PRIMARY_LANGUAGE and lang not in _NOT_LANG_SUFFIXES
+                and _LANG_SUFFIX.fullmatch(lang)):
+            plan.setdefault(field, []).append((lang, column))
+    return {field: tuple(columns) for field, columns in plan.items()}
+
+def _row_translations(row, columns):
+    """
+    The (lang, text) pairs of one row for a field's columns (from
+    localized_columns or _row_layout), empty cells skipped.
+    """
+    if not columns:
+        return ()
+    return tuple((lang, text) for lang, column in columns if (text := (row[column] or "").strip()))
+
+def _localized(value, translations=()):
+    """
+    Returns the [{"lang": "el", "value": value, "verified": True}, ...]
+    structure for value, followed by one entry per (lang, text) pair in
+    translations (an empty value is only kept without any). Identical values share one interned object (see
+    clear_localized_cache), so, like the templates' values, it must never
+    be mutated in place. The cache is not bounded: only use it for values
+    that really repeat (category, option group and option value names),
+    and _item_localized() for per-item text.
+    """
+    key = (value, translations) if translations else value
+    localized = _localized_cache.get(key)
+    if localized is None:
+        localized = _localized_cache[key] = _new_localized(value, translations)
+    return localized
+
+def _item_localized(value, translations=()):
+    """
+    _localized() for per-item text (descriptions, more_information, ...):
+    items with the same text share one object as well, but only the
+    ITEM_TEXT_CACHE_SIZE most recently used texts are kept, so a feed of
+    unique texts cannot grow the cache with its size.
+    """
+    key = (value, translations) if translations else value
+    localized = _item_text_cache.get(key)
+    if localized is None:
+        localized = _item_text_cache[key] = _new_localized(value, translations)
+        if len(_item_text_cache) > ITEM_TEXT_CACHE_SIZE:
+            _item_text_cache.popitem(last=False)
+    else:
+        _item_text_cache.move_to_end(key)
+    return localized
+
+def _new_localized(value, translations=()):
+    # for values that rarely repeat (item names, ...): interning would only add a cache entry
+    localized = []
+    if value or not translations:  # an empty primary cell is left out when translations exist
+        localized.append({
+            "lang": PRIMARY_LANGUAGE,
+            "value": value,
+            "verified": True
+        })
+    for lang, text in translations:
+        localized.append({"lang": lang, "value": text, "verified": True})
+    return localized
+
+# value -> shared localized structure, filled by _localized()
+_localized_cache = {}
+
+# the same for _item_localized(), least recently used first
+ITEM_TEXT_CACHE_SIZE = 10000
+_item_text_cache = OrderedDict()
+
+def clear_localized_cache():
+    """Drops the interned localized values; main() calls it before and after every build."""
+    _localized_cache.clear()
+    _item_text_cache.clear()
+
+# items.csv columns every row must fill
+_REQUIRED_ITEM_COLUMNS = ("price", "name", "cat_name")
+
+def _records_to_columns(fieldnames, records, names=None):
+    """
+    Turns csv.reader records into {name: [stripped values]}, one list per
+    column, or only for the columns in 'names' that the header has.
+    """
+    width = len(fieldnames)
+    if any(len(record) != width for record in records):
+        # short rows read as empty cells, extra cells are dropped
+        records = [(record + [""] * width)[:width] for record in records]
+    # a repeated header name keeps its last column, like csv.DictReader
+    positions = {name: position for position, name in enumerate(fieldnames)}
+    return {name: [record[position].strip() for record in records]
+            for name, position in positions.items() if names is None or name in names}
+
+def read_items_csv(items_csv_path, raise_errors=True):
+    """
+    Reads items.csv exactly once into typed columns and validates it.
+    Both cats_gen() and items_gen() accept the returned table, so the
+    (often very large) items feed is only decoded a single time per build.
+    Every value is stripped, and "price" is converted in one batch into
+    integer cents (see prices_to_cents). All bad rows are logged before a
+    single ValueError is raised, instead of stopping at the first one;
+    with raise_errors=False they are only kept in the table, for
+    validate_inputs(items_table=...), and the table must not be built.
+    Returns a dict: {"fieldnames": [...], "columns": {name: [values in file order]},
+    "baseprice": [cents per row], "count": number of rows, "errors": [(row, message)]}.
+    """
+    with open(items_csv_path, mode='r', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        fieldnames = next(reader, None) or []
+        records = [record for record in reader if record]
+
+    columns = _records_to_columns(fieldnames, records)
+    count = len(records)
+    del records
+
+    baseprice, errors = _item_column_errors(columns)
+    if errors and raise_errors:
+        for row_index, message in errors:
+            _log_error("ERROR at row %d: %s", row_index, message)
+        raise ValueError(f"ERROR: items.csv has {len({row for row, _ in errors})} invalid rows "
+                         f"({len(errors)} errors, see above). Aborting.")
+
+    return {"fieldnames": fieldnames, "columns": columns, "baseprice": baseprice, "count": count, "errors": errors}
+
+def prices_to_cents(prices):
+    """
+    Converts a column of price strings into integer cents, exactly like
+    int(round(float(price) * 100)) per value. With NumPy the whole column
+    is parsed and rounded at once. Returns (cents, bad): bad lists the
+    positions that are not finite numbers, their cents are None.
+    """
+    if np is not None:
+        try:
+            cents = np.rint(np.array(prices, dtype=np.float64) * 100)
+        except ValueError:
+            pass  # some price is not a number: the loop below finds which ones
+        else:
+            # also rejects nan and inf (every comparison with nan is False)
+            if (np.abs(cents) < 2 ** 63).all():
+                return cents.astype(np.int64).tolist(), []
+
+    cents = []
+    bad = []
+    for position, price in enumerate(prices):
+        try:
+            cents.append(int(round(float(price) * 100)))
+        except (ValueError, OverflowError):
+            cents.append(None)
+            bad.append(position)
+    return cents, bad
+
+def _item_column_errors(columns, start_row=1):
+    """
+    Batch-validates stripped items.csv columns (rows numbered from
+    start_row). Returns (baseprice, errors): the price column in cents, or
+    None if there is no price column, and a list of (row, message) sorted
+    by row. Missing columns are left to _prepare_item_context().
+    """
+    errors = []
+    for col in _REQUIRED_ITEM_COLUMNS:
+        values = columns.get(col)
+        if values is not None:
+            errors.extend((row_index, f"'{col}' is empty")
+                          for row_index, value in enumerate(values, start=start_row) if not value)
+
+    baseprice = None
+    prices = columns.get("price")
+    if prices is not None:
+        baseprice, bad = prices_to_cents(prices)
+        errors.extend((position + start_row, f"price='{prices[position]}' is not a number")
+                      for position in bad if prices[position])
+
+    enabled = columns.get("enabled")
+    if enabled is not None:
+        errors.extend((row_index, f"Invalid 'enabled' value '{value}'. Must be 'YES' or 'NO'.")
+                      for row_index, value in enumerate(enabled, start=start_row)
+                      if value and value.upper() not in ("YES", "NO"))
+
+    errors.sort(key=lambda error: error[0])
+    return baseprice, errors
+
+def _row_layout(fieldnames, fields, localized_fields=()):
+    """
+    Plans the row tuples _table_rows() yields for a reader of 'fields':
+    returns (row_fields, lang_columns), where row_fields is 'fields'
+    followed by the language-suffixed columns of localized_fields, and
+    lang_columns is localized_columns() with every column replaced by its
+    position in the tuple, ready for _row_translations().
+    """
+    row_fields = list(fields)
+    lang_columns = {}
+    for field, columns in localized_columns(fieldnames, localized_fields).items():
+        positions = []
+        for lang, column in columns:
+            positions.append((lang, len(row_fields)))
+            row_fields.append(column)
+        lang_columns[field] = tuple(positions)
+    return tuple(row_fields), lang_columns
+
+def _table_rows(items_table, row_fields):
+    """
+    Yields one tuple per items_table row with the values of row_fields,
+    zipped straight from the columns. "baseprice" is the typed price
+    column; a column missing from items.csv reads as "".
+    """
+    columns = items_table["columns"]
+    selected = []
+    for name in row_fields:
+        if name == "baseprice":
+            selected.append(items_table["baseprice"])
+        else:
+            column = columns.get(name)
+            selected.append(repeat("", items_table["count"]) if column is None else column)
+    return zip(*selected)
+
+# columns each input CSV must have, as checked by the builders themselves
+_REQUIRED_CSV_COLUMNS = {
+    "items": _REQUIRED_ITEM_COLUMNS,
+    "options": ("merchant_sku", "opt_name"),
+    "images": ("merchant_sku", "image_url"),
+}
+
+# the columns _validate_csv_chunk() looks at
+_VALIDATED_CSV_COLUMNS = dict(_REQUIRED_CSV_COLUMNS, items=_REQUIRED_ITEM_COLUMNS + ("enabled",))
+
+def _validate_csv_chunk(kind, fieldnames, start_row, records):
+    """
+    Checks one chunk of csv.reader records of an input CSV (kind is a key
+    of _REQUIRED_CSV_COLUMNS), rows numbered from start_row like the
+    builders number them. Returns (errors, warnings, sku_counts), each
+    problem a (row, message) pair: errors would abort the build, warnings
+    are rows the build skips. sku_counts counts the images per merchant_sku
+    (images.csv only, else None).
+    """
+    columns = _records_to_columns(fieldnames, records, _VALIDATED_CSV_COLUMNS[kind])
+    errors = []
+    warnings = []
+    sku_counts = None
+    if kind == "items":
+        _, errors = _item_column_errors(columns, start_row)
+    elif kind == "options":
+        for row_index, (merchant_sku, opt_name) in enumerate(zip(columns["merchant_sku"], columns["opt_name"]),
+                                                             start=start_row):
+            if not merchant_sku:
+                warnings.append((row_index, "empty 'merchant_sku', row skipped"))
+            elif not opt_name:
+                warnings.append((row_index, f"merchant_sku='{merchant_sku}' has an empty 'opt_name', row skipped"))
+    else:
+        sku_counts = Counter()
+        for row_index, (merchant_sku, image_url) in enumerate(zip(columns["merchant_sku"], columns["image_url"]),
+                                                              start=start_row):
+            if not merchant_sku or not image_url:
+                warnings.append((row_index, "empty 'merchant_sku' or 'image_url', row skipped"))
+            else:
+                sku_counts[merchant_sku] += 1
+    return errors, warnings, sku_counts
 
-def generate_random_id():
-    hex_chars = "0123456789abcdef"
-    while True: 
-        first_chars = 'ID'
-        suffix = ''.join(random.choice(hex_chars) for _ in range(23))
-        new_id = first_chars + suffix
-        if new_id not in generated_ids:  # ensuring that is **not** unique
-            generated_ids.add(new_id) 
-            return new_id  
+def _validate_csv(kind, csv_path, chunk_rows):
+    """
+    Streams one input CSV through _validate_csv_chunk(), chunk_rows records
+    at a time, so only one chunk is in memory at once.
+    Returns the file's entry of the validate_inputs() report.
+    """
+    result = {"path": csv_path, "rows": 0, "errors": [], "warnings": []}
+    with open(csv_path, mode='r', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        fieldnames = next(reader, None) or []
+        missing = [col for col in _REQUIRED_CSV_COLUMNS[kind] if col not in fieldnames]
+        if missing:
+            # row None: the problem is the header itself
+            result["errors"] = [{"row": None, "message": f"missing column '{col}'"} for col in missing]
+            return result
+
+        sku_counts = Counter()
+        while True:
+            chunk = list(islice(reader, chunk_rows))
+            if not chunk:
+                break
+            records = [record for record in chunk if record]
+            start_row = result["rows"] + 1
+            result["rows"] += len(records)
+            errors, warnings, counts = _validate_csv_chunk(kind, fieldnames, start_row, records)
+            result["errors"].extend({"row": row, "message": message} for row, message in errors)
+            result["warnings"].extend({"row": row, "message": message} for row, message in warnings)
+            if counts:
+                sku_counts.update(counts)
+
+    for merchant_sku, count in sku_counts.items():
+        if count > 5:
+            result["warnings"].append({"row": None, "message": f"merchant_sku='{merchant_sku}' has {count} images, "
+                                                               f"only the first 5 are kept"})
+    return result
+
+def _items_table_report(items_csv, items_table):
+    # the items.csv entry of the report, from a table read_items_csv() already checked
+    result = {"path": items_csv, "rows": items_table["count"], "errors": [], "warnings": []}
+    missing = [col for col in _REQUIRED_ITEM_COLUMNS if col not in items_table["fieldnames"]]
+    if missing:
+        result["errors"] = [{"row": None, "message": f"missing column '{col}'"} for col in missing]
+    else:
+        result["errors"] = [{"row": row, "message": message} for row, message in items_table["errors"]]
+    return result
+
+def validate_inputs(items_csv, options_csv, images_csv=None, chunk_rows=50000, report_json=None, items_table=None):
+    """
+    Checks items.csv, options.csv and images.csv (skipped if None) in one
+    cheap streaming pass that builds nothing, and collects every problem
+    with its row number instead of stopping at the first one.
+    Errors are what would make the build fail: missing columns, empty
+    price/name/cat_name, non-numeric prices, invalid 'enabled' values.
+    Warnings are rows the build skips or trims.
+    If items_table (from read_items_csv(..., raise_errors=False)) is given,
+    its errors are reported instead of reading items.csv again.
+    Returns the report ({"valid", "errors", "warnings", "files": {"items":
+    {"path", "rows", "errors": [{"row", "message"}], "warnings": [...]}, ...}}),
+    logs its errors and a summary, and saves it to report_json if given.
+    """
+    files = {}
+    if items_table is not None:
+        files["items"] = _items_table_report(items_csv, items_table)
+    else:
+        files["items"] = _validate_csv("items", items_csv, chunk_rows)
+    files["options"] = _validate_csv("options", options_csv, chunk_rows)
+    if images_csv is not None:
+        files["images"] = _validate_csv("images", images_csv, chunk_rows)
+
+    report = {
+        "valid": not any(result["errors"] for result in files.values()),
+        "errors": sum(len(result["errors"]) for result in files.values()),
+        "warnings": sum(len(result["warnings"]) for result in files.values()),
+        "files": files,
+    }
+    for kind, result in files.items():
+        for error in result["errors"]:
+            if error["row"] is None:
+                _log_error("ERROR in %s.csv: %s", kind, error["message"])
+            else:
+                _log_error("ERROR in %s.csv at row %d: %s", kind, error["row"], error["message"])
+    logger.info("🔎 Validation: %s rows checked, %d errors, %d warnings",
+                " + ".join(f"{result['rows']} {kind}" for kind, result in files.items()),
+                report["errors"], report["warnings"])
+    if report_json:
+        with open(report_json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+MANIFEST_VERSION = 1
+
+def row_content_hash(values):
+    """Returns a short hex digest of one CSV row's values, in column order."""
+    h = hashlib.blake2b(digest_size=12)
+    for value in values:
+        h.update(value.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+def item_row_keys(items_table):
+    """
+    Returns (row_keys, row_hashes) for the rows of items_table.
+    A row's key is its merchant_sku, or its content hash when it has none,
+    so the same product keeps its key (and therefore its IDs) across builds
+    even when other columns change or rows are reordered.
+    """
+    fieldnames = items_table["fieldnames"]
+    row_keys = []
+    row_hashes = {}
+    seen = Counter()
+    skus = _table_rows(items_table, ("merchant_sku",))
+    for (merchant_sku,), values in zip(skus, _table_rows(items_table, fieldnames)):
+        content_hash = row_content_hash(values)
+        row_key = merchant_sku or f"hash:{content_hash}"
+        seen[row_key] += 1
+        if seen[row_key] > 1:
+            # repeated SKU (or identical SKU-less rows): number the repeats to keep keys unique
+            row_key = f"{row_key}#{seen[row_key] - 1}"
+        row_keys.append(row_key)
+        row_hashes[row_key] = content_hash
+    return row_keys, row_hashes
+
+def load_manifest(manifest_path):
+    """
+    Loads a build manifest written by save_manifest(). Returns an empty
+    manifest if the file does not exist or was written by another version.
+    """
+    empty = {"version": MANIFEST_VERSION, "ids": {}, "row_hashes": {}}
+    if not manifest_path or not os.path.exists(manifest_path):
+        return empty
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        _log_warning("⚠️ Ignoring manifest %s: version %s, expected %s",
+                     manifest_path, manifest.get("version"), MANIFEST_VERSION)
+        return empty
+    return manifest
+
+def save_manifest(manifest_path, ids, row_hashes):
+    """Writes the manifest atomically, so a failed build never leaves a half-written one."""
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "ids": ids, "row_hashes": row_hashes}, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def diff_row_hashes(previous, current):
+    """Counts rows added, changed, unchanged and removed between two builds' row hashes."""
+    counts = Counter()
+    for row_key, content_hash in current.items():
+        old = previous.get(row_key)
+        if old is None:
+            counts["rows_added"] += 1
+        elif old == content_hash:
+            counts["rows_unchanged"] += 1
+        else:
+            counts["rows_changed"] += 1
+    counts["rows_removed"] = sum(1 for row_key in previous if row_key not in current)
+    return counts
 
-def cats_gen(items_csv_path):
+def cats_gen(items_csv_path, items_table=None, stats=None):
     """
     Reads items.csv to find all unique cat_name has something something.
     Then builds a 'catalog' dictionary has something something, including:
@@ -37,20 +852,36 @@ def cats_gen(items_csv_path):
       - A random ID for the catalog $oid
       - next_category_local_id, primary_language, etc.
     Returns a dictionary that you can later insert into your final JSON.
+
+    If items_table (from read_items_csv) is given, its rows are reused
+    instead of reading items.csv again. If a stats Counter is given, the
+    number of 'Misc' subcategories created is added to it.
     """
 
-    cat_subcat_pairs = set()
-
-    with open(items_csv_path, mode='r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            cat_name = row.get("cat_name", "").strip()
-            sub_cat = row.get("sub_cat", "").strip()
-            if cat_name:  
-                cat_subcat_pairs.add((cat_name, sub_cat))
+    if items_table is None:
+        items_table = read_items_csv(items_csv_path)
+
+    # categories and subcategories are laid out in first-seen order, so the
+    # same items.csv always gives the same catalog
+    cats_to_subcats = {}
+    # cat_name_en, sub_cat_de, ...: a category's translations come from its first row
+    row_fields, lang_columns = _row_layout(items_table["fieldnames"], ("cat_name", "sub_cat"), ("cat_name", "sub_cat"))
+    cat_columns = lang_columns.get("cat_name")
+    sub_cat_columns = lang_columns.get("sub_cat")
+    cat_translations = {}
+
+    for row in _table_rows(items_table, row_fields):
+        cat_name, sub_cat = row[0], row[1]
+        if cat_name:  
+            subcats = cats_to_subcats.get(cat_name)
+            if subcats is None:
+                subcats = cats_to_subcats[cat_name] = {}
+                cat_translations[cat_name] = _row_translations(row, cat_columns)
+            if sub_cat not in subcats:
+                subcats[sub_cat] = _row_translations(row, sub_cat_columns) if sub_cat else ()
 
     #$oid and top-level fields
-    cata_id = generate_random_id()  # random ID for the catalog itself
+    cata_id = generate_random_id(("catalog",))  # random ID for the catalog itself
 
     cata_obj = {
         "$oid": {"_id": cata_id},
@@ -79,10 +910,6 @@ def cats_gen(items_csv_path):
             }
         }
     }
-    from collections import defaultdict
-    cats_to_subcats = defaultdict(set)
-    for (c, sc) in cat_subcat_pairs:
-        cats_to_subcats[c].add(sc)
     cat_id_map = {}
     cat_name_map = {}
     main_cats_map = {}
@@ -90,27 +917,17 @@ def cats_gen(items_csv_path):
     local_id_counter = 0
     for c_name, subcats in cats_to_subcats.items():
         # random ID for the main category
-        cat_oid = generate_random_id()
-        main_cat_obj = {
-            "child_category_ids": [],
-            "description": [],
-            "id": {"_id": cat_oid},
-            "image": "",
-            "image_blur": "",
-            "items": [], 
-            "local": local_id_counter,
-            "name": [
-                {
-                    "lang": "el",
-                    "value": c_name, 
-                    "verified": True
-                }
-            ]
-        }
+        cat_oid = generate_random_id(("category", c_name, ""))
+        main_cat_obj = _MAIN_CATEGORY_TEMPLATE.copy()
+        main_cat_obj["child_category_ids"] = []
+        main_cat_obj["id"] = {"_id": cat_oid}
+        main_cat_obj["items"] = []
+        main_cat_obj["local"] = local_id_counter
+        main_cat_obj["name"] = _localized(c_name, cat_translations[c_name])
         local_id_counter += 1
         main_cats_map[c_name] = main_cat_obj
         cata_obj["categories"].append(main_cat_obj)
-        real_subcats = {s for s in subcats if s}
+        real_subcats = [s for s in subcats if s]
 
         if not real_subcats:
             # means it has NO subcategories. later items will go here
@@ -118,61 +935,35 @@ def cats_gen(items_csv_path):
             pass
         else:
             for sc_name in real_subcats:
-                sc_oid = generate_random_id()
-                sc_obj = {
-                    "child_category_ids": [],
-                    "description": [],
-                    "id": {"_id": sc_oid},
-                    "image": "",
-                    "image_blur": "",
-                    "......": [],
-                    "......": [],
-                    "......": [],
-                    "......": [],
-                    "......": [],
-                    "local": local_id_counter,
-                    "name": [
-                        {
-                            "lang": "el",
-                            "value": sc_name,
-                            "verified": True
-                        }
-                    ],
-                    "parent_category_id": {"_id": cat_oid}
-                }
+                sc_oid = generate_random_id(("category", c_name, sc_name))
+                sc_obj = _SUB_CATEGORY_TEMPLATE.copy()
+                sc_obj["child_category_ids"] = []
+                sc_obj["id"] = {"_id": sc_oid}
+                sc_obj["items"] = []
+                sc_obj["local"] = local_id_counter
+                sc_obj["name"] = _localized(sc_name, subcats[sc_name])
+                sc_obj["parent_category_id"] = {"_id": cat_oid}
                 local_id_counter += 1
                 main_cat_obj["child_category_ids"].append({"_id": sc_oid})
                 subcat_map[(c_name, sc_name)] = sc_obj
                 cata_obj["categories"].append(sc_obj)
 
             if "" in subcats:
-                misc_oid = generate_random_id()
-                misc_obj = {
-                    "child_category_ids": [],
-                    "......": [],
-                    "......": [],
-                    "......": [],
-                    "......": [],
-                    "......": [],
-                    "id": {"_id": misc_oid},
-                    "image": "",
-                    "image_blur": "",
-                    "items": [],
-                    "local": local_id_counter,
-                    "name": [
-                        {
-                            "lang": "el",
-                            "value": "Misc",
-                            "verified": True
-                        }
-                    ],
-                    "parent_category_id": {"_id": cat_oid}
-                }
+                misc_oid = generate_random_id(("category_misc", c_name))
+                misc_obj = _MISC_CATEGORY_TEMPLATE.copy()
+                misc_obj["child_category_ids"] = []
+                misc_obj["id"] = {"_id": misc_oid}
+                misc_obj["items"] = []
+                misc_obj["local"] = local_id_counter
+                misc_obj["name"] = _localized("Misc")
+                misc_obj["parent_category_id"] = {"_id": cat_oid}
                 local_id_counter += 1
                 main_cat_obj["child_category_ids"].append({"_id": misc_oid})
                 subcat_map[(c_name, "Misc")] = misc_obj
                 cata_obj["categories"].append(misc_obj)
-                print(f"📌 Created 'Misc' subcategory for '{c_name}' to store unclassified items.")
+                logger.debug("📌 Created 'Misc' subcategory for '%s' to store unclassified items.", c_name)
+                if stats is not None:
+                    stats["misc_categories"] += 1
 
     cat_map = {}
     for c_name, cat_obj in main_cats_map.items():
@@ -182,7 +973,7 @@ def cats_gen(items_csv_path):
 
     return cata_obj, cat_map
 
-def opts_gen(options_csv_path, cata_id):
+def opts_gen(options_csv_path, cata_id, dedup=False):
     """
     Reads options.csv which MUST have columns: an identifier and 'opt_name'.
     Groups rows by (merchant_sku, dis_name) => each group => 1 "option combination".
@@ -190,6 +981,14 @@ def opts_gen(options_csv_path, cata_id):
 
     If dis_name is empty, we default it to "Επίλεξε νούμερο".
     If ext_id, price_markup, etc. exist, we store them as well.
+    Returns (options_list, sku_to_options): the option docs, and an index
+    merchant_sku -> [(dis_name, option ID), ...] of every option group of
+    that SKU in options.csv order, built in the same pass, for linking items.
+
+    With dedup=True, groups with the same fingerprint (dis_name and the
+    ordered values' names, price_markup and ext_id, translations included)
+    share one option doc, which every such SKU's items link to. Its IDs are
+    keyed on the fingerprint instead of a SKU.
     """
 
     import csv
@@ -202,14 +1001,18 @@ def opts_gen(options_csv_path, cata_id):
         for col in required_cols:
             if col not in reader.fieldnames:
                 raise ValueError(f"ERROR: has something something have column '{col}'.")
+        # dis_name_en, opt_name_de, ...: a group's name translations come from its first row
+        lang_columns = localized_columns(reader.fieldnames, ("dis_name", "opt_name"))
+        dis_name_columns = lang_columns.get("dis_name")
+        opt_name_columns = lang_columns.get("opt_name")
         for row in reader:
             merchant_sku = row["merchant_sku"].strip()
             opt_name = row["opt_name"].strip()
             if not merchant_sku:
-                print("Warning: has something something. Skipping.")
+                _log_warning("Warning: has something something. Skipping.")
                 continue
             if not opt_name:
-                print(f"Warning: row for merchant_sku=........' has something something name. Skipping.")
+                _log_warning("Warning: row for merchant_sku=........' has something something name. Skipping.")
                 continue
             dis_name = row.get("dis_name", "").strip()
             if not dis_name:
@@ -217,84 +1020,54 @@ def opts_gen(options_csv_path, cata_id):
             combo_map[(merchant_sku, dis_name)].append(row)
 
     final_options = []
+    sku_to_options = defaultdict(list)
+    shared_options = {}  # group fingerprint -> option ID, with dedup
 
     for (merchant_sku, dis_name), row_list in combo_map.items():
-        combo_id = generate_random_id()
-
-        option_obj = {
-            "$oid": {"_id": combo_id},
-            "default_value": None,
-            "......": [],
-            "......": [],
-            "......": [],
-            "......": [],
-            "......": [],
-            "cata_id": {"_id": cata_id},
-            "name": [
-                {
-                    "lang": "el",
-                    "value": dis_name,      
-                    "verified": True
-                }
-            ],
-            "type": "choice",
-
-            "v": {
-                "author": {
-                    "id": "60a28b421f64e098f8e21493",
-                    "kind": "user"
-                },
-                "created_at": {"$date": 1739358269656},
-                "is_removed": False,
-                "num": 999,
-                "orig_id": {"_id": combo_id}
-            },
-
-            "values": []
+        dis_translations = _row_translations(row_list[0], dis_name_columns)
+        values = [(row_data["opt_name"].strip(), _row_translations(row_data, opt_name_columns),
+                   row_data.get("price_markup", "").strip(), row_data.get("ext_id", "").strip())
+                  for row_data in row_list]
+
+        if dedup:
+            fingerprint = (dis_name, dis_translations, tuple(values))
+            shared_id = shared_options.get(fingerprint)
+            if shared_id is not None:
+                sku_to_options[merchant_sku].append((dis_name, shared_id))
+                continue
+            group_key = hashlib.blake2b(repr(fingerprint).encode("utf-8"), digest_size=12).hexdigest()
+            combo_id = generate_random_id(("option_group", group_key))
+        else:
+            combo_id = generate_random_id(("option", merchant_sku, dis_name))
+
+        option_obj = _OPTION_TEMPLATE.copy()
+        option_obj["$oid"] = {"_id": combo_id}
+        option_obj["cata_id"] = {"_id": cata_id}
+        option_obj["name"] = _localized(dis_name, dis_translations)
+        option_obj["v"] = {
+            "author": _AUTHOR.copy(),
+            "created_at": _CREATED_AT.copy(),
+            "is_removed": False,
+            "num": 999,
+            "orig_id": {"_id": combo_id}
         }
+        option_obj["values"] = []
         first_value_oid = None
-        for i, row_data in enumerate(row_list):
-            val_id = generate_random_id()
-            opt_name = row_data["opt_name"].strip()
-            ext_id = row_data.get("ext_id", "").strip()
-            price_markup_str = row_data.get("price_markup", "").strip()
-
-            value_obj = {
-                "id": {"_id": val_id},
-                "......": [],
-                "......": [],
-                "......": [],
-                "......": [],
-                "......": [],
-                "conditions_of_use_and_storage": [],
-                "country": [],
-                "dietary_preferences": [],
-                "distributor_information": [],
-                "......": [],
-                "ingredients": [],
-                "mandatory_warnings": [],
-                "name": [
-                    {
-                        "lang": "el",
-                        "value": opt_name,
-                        "verified": True
-                    }
-                ],
-                "nutrition_facts": [],
-                "producer_information": [],
-                "regulatory_information": [],
-                "......": [],
-                "......": [],
-                "......": [],
-                "......": [],
-                "......": []
-            }
+        for i, (opt_name, opt_translations, price_markup_str, ext_id) in enumerate(values):
+            if dedup:
+                val_id = generate_random_id(("option_group_value", group_key, opt_name))
+            else:
+                val_id = generate_random_id(("option_value", merchant_sku, dis_name, opt_name))
+
+            value_obj = _OPTION_VALUE_TEMPLATE.copy()
+            value_obj["id"] = {"_id": val_id}
+            value_obj["name"] = _localized(opt_name, opt_translations)
             if price_markup_str:
                 try:
                     price_markup_int = int(price_markup_str)
                     value_obj["price_markup"] = price_markup_int
                 except ValueError:
-                    print(f"Warning: price_markup='{price_markup_str}' is an integer. Skipping.")
+                    _log_warning("Warning: price_markup='%s' is an integer. Skipping.", price_markup_str)
 
             if i == 0:
                 first_value_oid = val_id
@@ -304,277 +1077,737 @@ def opts_gen(options_csv_path, cata_id):
             option_obj["default_value"] = {"_id": first_value_oid}
 
         final_options.append(option_obj)
+        sku_to_options[merchant_sku].append((dis_name, combo_id))
+        if dedup:
+            shared_options[fingerprint] = combo_id
 
-    return final_options
+    if dedup:
+        logger.info("♻️ %d option groups share %d distinct option docs.", len(combo_map), len(final_options))
+    return final_options, dict(sku_to_options)
 
-def items_gen(items_csv_path, cata_id, options_list, cat_map, sku_to_images):
+def iter_items(items_csv_path, cata_id, sku_to_options, cat_map, sku_to_images, items_table=None, row_keys=None,
+               image_policy="keep"):
     """
-    Reads items.csv and produces a list of item objects in the desired JSON structure. MANDATORY AND NON-MANDATORY FIELDS__
+    Reads items.csv and yields item objects, one per row, in the desired JSON structure. MANDATORY AND NON-MANDATORY FIELDS__
     - 'producer_information': If present and non-empty => array of localized objects with lang='el'.
     - 'enabled': Must be 'YES' or 'NO' if present => sets item_doc["enabled"].
     - 'in_stock': Must be 'Y' or 'N' if present => 'N' => item_doc["inventory_mode"]='forced_out_of_stock',
       'Y' => omit the attribute, else error.
     - 'more_information': if present => array of localized objects with lang='el'.
+
+    If items_table (from read_items_csv) is given, its rows are reused
+    instead of reading items.csv again. row_keys (from item_row_keys), one
+    per row, lets keyed ID generators recognise the same item across builds.
+    image_policy (see IMAGE_POLICIES) is applied to each item as it is built.
     """
 
-    externalid_to_option = {}
-    for opt_doc in options_list:
-        key = opt_doc.get("external_id", "")
-        if key:
-            externalid_to_option[key] = opt_doc
+    if items_table is None:
+        items_table = read_items_csv(items_csv_path)
 
-    items = []
-    
-    with open(items_csv_path, mode='r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames
+    ctx = _prepare_item_context(items_table["fieldnames"], cata_id, sku_to_options, cat_map, sku_to_images,
+                                image_policy)
 
-        required_cols = ["price", "name", "cat_name"]
-        for col in required_cols:
-            if col not in fieldnames:
-                raise ValueError(f"ERROR: items.csv has a .....'{col}'")
-
-        has_more_info = "more_information" in fieldnames
-        has_producer_info = "producer_information" in fieldnames
-        has_enabled_col = "enabled" in fieldnames
-        has_in_stock_col = "in_stock" in fieldnames
-        has_description = "description" in fieldnames
-        has_brand_id = "brand_id" in fieldnames
-        
-        for row_index, row in enumerate(reader, start=1):
-            price_str = row.get("price", "").strip()
-            name_str = row.get("name", "").strip()
-            cat_name_str = row.get("cat_name", "").strip()
-
-            if not price_str or not name_str or not cat_name_str:
-                print(f"ERROR at row {row_index}:..........")
-                raise ValueError("columns may be empty.......... Aborting.")
-
-            sub_cat_str = row.get("sub_cat", "").strip()
-            item_id = generate_random_id()
+    for row_index, row in enumerate(_table_rows(items_table, ctx["row_fields"]), start=1):
+        row_key = None if row_keys is None else row_keys[row_index - 1]
+        item_doc, cat_key, cat_link = _build_item(row, row_index, ctx, row_key)
+        if cat_key is not None:
+            cat_map[cat_key]["items"].append(cat_link)
+        yield item_doc
 
-            try:
-                price_float = float(price_str)
-            except ValueError:
-                print(f"ERROR: price='{price_str}' is not a number (row {row_index}).")
-                raise
-            baseprice = int(round(price_float * 100))
-
-            item_doc = {
-                "$oid": {"_id": item_id},
-                "additives": [],
-                "alcohol_percentage": 0,
-                "allergens": [],
-                "baseprice": baseprice,
-                "color": [],
-                "conditions_of_use_and_storage": [],
-                "country": [],
-                "courier_restrictions": [],
-                "delivery_methods": [],
-                "description": [],
-                "dietary_preferences": [],
-                "unit_type": "single_unit",
-                "number_of_units": 1,
-                "distributor_information": [],
-                "enabled": {"enabled": True},  # default = True
-                "external_id": row.get("external_id", "").strip(),
-                "image": row.get("image", "").strip(),
-                "image_blur": row.get("image_blur", "").strip(),
-                "images": [],
-                "ingredients": [],
-                "is_bundle_offer": False,
-                "is_over_the_counter": False,
-                "mandatory_warnings": [],
-                "cata_id": {"_id": cata_id},
-                "merchant_sku": row.get("merchant_sku", "").strip(),
-                "more_information": [],
-                "name": [
-                    {
-                        "lang": "el",
-                        "value": name_str,
-                        "verified": True
-                    }
-                ],
-                "nutrition_facts": [],
-                "nutrition_values": [],
-                "offering_platform_metadata": {
-                    "id": {"_id": generate_random_id()}
-                },
-                "options": [],
-                "producer_information": [],  # default empty
-                "regulatory_information": [],
-                "size": [],
-                "user_requirements": [],
-                "v": {
-                    "author": {
-                        "id": "60a28b421f64e098f8e21493",
-                        "kind": "user"
-                    },
-                    "created_at": {"$date": 1739358269656},
-                    "is_removed": False,
-                    "num": 999,
-                    "orig_id": {"_id": item_id}
-                }
-            }
-            if has_brand_id:
-                brand_val = row["brand_id"].strip()
-                if brand_val:
-                    item_doc["brand_id"] = brand_val
-            if has_description:
-                desc_val = row["description"].strip()
-                if desc_val:
-                    item_doc["description"] = [
-                        {
-                            "lang": "el",
-                            "value": desc_val,
-                            "verified": True
-                        }
-                    ]
-            if has_more_info:
-                more_info_val = row["more_information"].strip()
-                if more_info_val:
-                    item_doc["more_information"] = [
-                        {
-                            "lang": "el",
-                            "value": more_info_val,
-                            "verified": True
-                        }
-                    ]
-            if has_producer_info:
-                producer_val = row["producer_information"].strip()
-                if producer_val:
-                    item_doc["producer_information"] = [
-                        {
-                            "lang": "el",
-                            "value": producer_val,
-                            "verified": True
-                        }
-                    ]
-            if has_enabled_col:
-                enabled_val = row["enabled"].strip().upper()  #  'YES' or 'NO'
-                if enabled_val:
-                    if enabled_val == "YES":
-                        item_doc["enabled"] = {"enabled": True}
-                    elif enabled_val == "NO":
-                        item_doc["enabled"] = {"enabled": False}
-                    else:
-                        raise ValueError(f"Invalid 'enabled' value '{enabled_val}' at row {row_index}. "
-                                         f"Must be 'YES' or 'NO'.")
-                # if blank, we do nothing (default True)
+# the row tuple _build_item() unpacks, see _table_rows()
+_ITEM_ROW_FIELDS = ("baseprice", "name", "cat_name", "sub_cat", "merchant_sku", "external_id", "image", "image_blur",
+                    "brand_id", "more_information", "producer_information", "enabled", "delivery_methods",
+                    "description")
 
-            item_doc["inventory_mode"] = ""
+def _prepare_item_context(fieldnames, cata_id, sku_to_options, cat_map, sku_to_images, image_policy="keep"):
+    """
+    Validates the items.csv header and precomputes the per-build lookups
+    _build_item() needs. sku_to_options is the index returned by opts_gen(),
+    image_policy one of IMAGE_POLICIES. Holds only plain data, so it can be
+    shipped to worker processes as is (see iter_items_parallel).
+    """
+    for col in _REQUIRED_ITEM_COLUMNS:
+        if col not in fieldnames:
+            raise ValueError(f"ERROR: items.csv has a .....'{col}'")
+
+    # name_en, description_de, ... (see localized_columns)
+    row_fields, lang_columns = _row_layout(fieldnames, _ITEM_ROW_FIELDS,
+                                           ("name", "description", "more_information", "producer_information"))
+
+    return {
+        "cata_id": cata_id,
+        "row_fields": row_fields,
+        "has_more_info": "more_information" in fieldnames or "more_information" in lang_columns,
+        "has_producer_info": "producer_information" in fieldnames or "producer_information" in lang_columns,
+        "lang_columns": lang_columns,
+        "has_in_stock_col": "in_stock" in fieldnames,
+        "sku_to_options": sku_to_options,
+        # (cat_name, sub_cat) => whether that category has child categories
+        "cat_routes": {key: bool(cat.get("child_category_ids")) for key, cat in cat_map.items()},
+        "sku_to_images": sku_to_images,
+        "image_policy": image_policy,
+    }
 
-            dm_val = row.get("delivery_methods", "").strip()
-            if dm_val:
-                item_doc["delivery_methods"] = [
-                    x.strip() for x in dm_val.split(",") if x.strip()
-                ]
-            else:
-                item_doc["delivery_methods"] = ["eatin","takeaway","homedelivery"]
-            desc_val = row.get("description", "").strip()
-            if desc_val:
-                item_doc["description"] = [
-                    {
-                        "lang": "el",
-                        "value": desc_val,
-                        "verified": True
-                    }
-                ]
+def _build_item(row, row_index, ctx, row_key=None):
+    """
+    Builds the item doc for one items.csv row, a tuple laid out as
+    ctx["row_fields"] (see _table_rows) from a table that read_items_csv()
+    already validated. row_key (see item_row_keys) names the row for keyed
+    ID generators.
+    Returns (item_doc, cat_key, cat_link): cat_link must be appended to
+    cat_map[cat_key]["items"] by the caller, cat_key is None if the item
+    could not be attached to any category.
+    """
+    (baseprice, name_str, cat_name_str, sub_cat_str, merchant_sku, external_id, image, image_blur, brand_val,
+     more_info_val, producer_val, enabled_val, dm_val, desc_val) = row[:len(_ITEM_ROW_FIELDS)]
+
+    item_id = generate_random_id(None if row_key is None else ("item", row_key))
+
+    item_doc = _ITEM_TEMPLATE.copy()
+    item_doc["$oid"] = {"_id": item_id}
+    item_doc["baseprice"] = baseprice
+    item_doc["external_id"] = external_id
+    item_doc["image"] = image
+    item_doc["image_blur"] = image_blur
+    item_doc["images"] = []
+    item_doc["cata_id"] = {"_id": ctx["cata_id"]}
+    item_doc["merchant_sku"] = merchant_sku
+    lang_columns = ctx["lang_columns"]
+    item_doc["name"] = _new_localized(name_str, _row_translations(row, lang_columns.get("name")))
+    item_doc["offering_platform_metadata"] = {
+        "id": {"_id": generate_random_id(None if row_key is None else ("item_metadata", row_key))}
+    }
+    item_doc["options"] = []
+    item_doc["v"] = {
+        "author": _AUTHOR.copy(),
+        "created_at": _CREATED_AT.copy(),
+        "is_removed": False,
+        "num": 999,
+        "orig_id": {"_id": item_id}
+    }
+    if brand_val:
+        item_doc["brand_id"] = brand_val
+    if ctx["has_more_info"]:
+        more_info_translations = _row_translations(row, lang_columns.get("more_information"))
+        if more_info_val or more_info_translations:
+            item_doc["more_information"] = _item_localized(more_info_val, more_info_translations)
+    if ctx["has_producer_info"]:
+        producer_translations = _row_translations(row, lang_columns.get("producer_information"))
+        if producer_val or producer_translations:
+            item_doc["producer_information"] = _item_localized(producer_val, producer_translations)
+    #  'YES' or 'NO', checked by read_items_csv(); if blank, default True
+    item_doc["enabled"] = {"enabled": not enabled_val or enabled_val.upper() == "YES"}
+
+    item_doc["inventory_mode"] = ""
+
+    if dm_val:
+        item_doc["delivery_methods"] = [
+            x.strip() for x in dm_val.split(",") if x.strip()
+        ]
+    else:
+        item_doc["delivery_methods"] = ["eatin","takeaway","homedelivery"]
+    desc_translations = _row_translations(row, lang_columns.get("description"))
+    if desc_val or desc_translations:
+        item_doc["description"] = _item_localized(desc_val, desc_translations)
+    else:
+        item_doc["description"] = _localized("")
+    image_policy = ctx["image_policy"]
+    extra_images = ctx["sku_to_images"].get(merchant_sku, []) if image_policy == "keep" else []
+
+    if len(extra_images) > 5:
+        # raise ValueError(f"Too many images ({len(extra_images)}) for merchant_sku='{merchant_sku}'!")
+        # OR just keep the first 5 & warn:
+        _log_error("ERROR: merchant_sku='%s' has %d images in images.csv; "
+                   "keeping only first 5. (row %d)", merchant_sku, len(extra_images), row_index)
+        extra_images = extra_images[:5]
+
+    for url in extra_images:
+        item_doc["images"].append({
+            "hash": "",
+            "url": url
+        })
+    
+    if item_doc["images"]:
+        first_img = item_doc["images"][0]
+
+        item_doc["image"] = first_img.get("url", "")  # main image url
+        item_doc["image_blur"] = first_img.get("hash", "")  # or some placeholder
+    else:
+        pass
+    if image_policy != "keep":
+        apply_item_image_policy(item_doc, image_policy)
+
+    # link item to every option group of its 'merchant_sku', in options.csv order
+    option_groups = ctx["sku_to_options"].get(merchant_sku) if merchant_sku else None
+    if option_groups:
+        for dis_name, option_id in option_groups:
+            link_id = generate_random_id(None if row_key is None else ("item_option", row_key, merchant_sku, dis_name))
+            option_reference = {
+                "id": {"_id": link_id},
+                "name": [],
+                "option_id": {"_id": option_id},
+                "prerequisite_values": []
+            }
+            item_doc["options"].append(option_reference)
+    # pick the category this item is linked to
+    cat_routes = ctx["cat_routes"]
+    cat_key = None
+    if sub_cat_str:
+        if (cat_name_str, sub_cat_str) in cat_routes:
+            cat_key = (cat_name_str, sub_cat_str)
+        elif (cat_name_str, "Misc") in cat_routes:
+            cat_key = (cat_name_str, "Misc")
+        else:
+            _log_warning("⚠️ WARNING: (cat_name='%s',sub_cat='%s') not found. No 'Misc' fallback.", cat_name_str, sub_cat_str)
+    else:
+        if (cat_name_str, "Misc") in cat_routes:
+            cat_key = (cat_name_str, "Misc")
+        elif (cat_name_str, "") in cat_routes:
+            if cat_routes[(cat_name_str, "")]:
+                _log_warning("⚠️ WARNING: Parent cat '%s' has subcats. '%s' not assigned.", cat_name_str, item_id)
             else:
-                item_doc["description"] = [
-                    {
-                        "lang": "el",
-                        "value": "",
-                        "verified": True
-                    }
-                ]
-            item_doc["image_blur"] = row.get("image_blur", "").strip()
-            merchant_sku = row.get("merchant_sku", "").strip()
-            extra_images = sku_to_images.get(merchant_sku, [])
-
-            if len(extra_images) > 5:
-                # raise ValueError(f"Too many images ({len(extra_images)}) for merchant_sku='{merchant_sku}'!")
-                # OR just keep the first 5 & warn:
-                print(f"ERROR: merchant_sku='{merchant_sku}' has {len(extra_images)} images in images.csv; " 
-                      f"keeping only first 5. (row {row_index})")
-                extra_images = extra_images[:5]
-
-            for url in extra_images:
-                item_doc["images"].append({
-                    "hash": "",
-                    "url": url
-                })
-            
-            if item_doc["images"]:
-                first_img = item_doc["images"][0]
+                cat_key = (cat_name_str, "")
+        else:
+            _log_error("❌ ERROR: No matching cat for (cat_name='%s', sub_cat='') => not attached.", cat_name_str)
 
-                item_doc["image"] = first_img.get("url", "")  # main image url
-                item_doc["image_blur"] = first_img.get("hash", "")  # or some placeholder
-            else:
-                pass
-
-            # link item to the correct option if 'merchant_sku' is present
-            merchant_sku = row.get("merchant_sku", "").strip()
-            if merchant_sku and merchant_sku in externalid_to_option:
-                matched_option = externalid_to_option[merchant_sku]
-                link_id = generate_random_id()
-                option_reference = {
-                    "id": {"_id": link_id},
-                    "name": [],
-                    "option_id": matched_option["$oid"],
-                    "prerequisite_values": []
-                }
-                item_doc["options"].append(option_reference)
-            if sub_cat_str:
-                if (cat_name_str, sub_cat_str) in cat_map:
-                    cat_map[(cat_name_str, sub_cat_str)]["items"].append({
-                        "id": {"_id": generate_random_id()},
-                        "item_id": {"_id": item_id}
-                    })
+    cat_link = None
+    if cat_key is not None:
+        cat_link = {
+            "id": {"_id": generate_random_id(None if row_key is None else ("item_category", row_key) + cat_key)},
+            "item_id": {"_id": item_id}
+        }
+    return item_doc, cat_key, cat_link
+
+def items_gen(items_csv_path, cata_id, sku_to_options, cat_map, sku_to_images, items_table=None, image_policy="keep"):
+    """
+    Same as iter_items() but returns all item objects as one list.
+    Use iter_items() with write_items() and a sink to avoid holding them all.
+    """
+    sink = ListSink()
+    write_items(iter_items(items_csv_path, cata_id, sku_to_options, cat_map, sku_to_images, items_table,
+                           image_policy=image_policy), sink)
+    return sink.items
+
+# Run first in every pool worker: pickled functions are found by module
+# name, and this file is loaded by path under a name that is not importable
+# (e.g. "json_builder", see benchmark.py). A forked worker already has it in
+# sys.modules; a spawned one loads it the same way before any task arrives.
+_WORKER_BOOTSTRAP = """
+import importlib.util, sys
+if module_name not in sys.modules:
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+if init_name:
+    getattr(sys.modules[module_name], init_name)(*init_args)
+"""
+
+def _process_pool(workers, mp_context=None, init_name=None, init_args=()):
+    """
+    Returns a ProcessPoolExecutor whose workers can run this module's
+    functions with any start method (mp_context, default: the platform's),
+    calling init_name(*init_args) from this module in each worker first.
+    """
+    # exec is a builtin, so the initializer itself pickles without this module
+    bootstrap = partial(exec, _WORKER_BOOTSTRAP, {
+        "module_name": __name__, "module_path": os.path.abspath(__file__),
+        "init_name": init_name, "init_args": init_args,
+    })
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=bootstrap)
+
+# per-process state of iter_items_parallel() workers
+_worker_item_ctx = None
+_worker_id_seed = None
+_worker_id_tracking = "compact"
+_worker_id_hash = None
+
+def _init_item_worker(ctx, id_seed, id_tracking, id_hash=None):
+    global _worker_item_ctx, _worker_id_seed, _worker_id_tracking, _worker_id_hash
+    _worker_item_ctx = ctx
+    _worker_id_seed = id_seed
+    _worker_id_tracking = id_tracking
+    _worker_id_hash = id_hash
+
+def _build_item_chunk(chunk_index, start_row, rows, row_keys=None):
+    # a fresh generator per chunk keeps seeded output independent of which
+    # worker picks the chunk up
+    if _worker_id_hash is not None:
+        set_id_generator(HashIdGenerator(*_worker_id_hash))
+    else:
+        seed = None if _worker_id_seed is None else f"{_worker_id_seed}:{chunk_index}"
+        set_id_generator(IdGenerator(seed=seed, tracking=_worker_id_tracking))
+    if row_keys is None:
+        row_keys = [None] * len(rows)
+    issues_before = _issue_counts.copy()
+    built = [_build_item(row, row_index, _worker_item_ctx, row_key)
+             for row_index, (row, row_key) in enumerate(zip(rows, row_keys), start=start_row)]
+    # the worker's counts never reach the parent otherwise
+    return built, _issue_counts - issues_before
+
+def iter_items_parallel(items_csv_path, cata_id, sku_to_options, cat_map, sku_to_images, items_table=None,
+                        workers=None, chunk_rows=10000, id_seed=None, id_tracking="compact",
+                        row_keys=None, id_hash=None, image_policy="keep", mp_context=None):
+    """
+    Parallel version of iter_items(). The items.csv rows are cut into
+    contiguous chunks of chunk_rows that are built by a ProcessPoolExecutor
+    with 'workers' processes (default: one per CPU). Results are merged
+    back in the original row order: items are yielded, and category links
+    appended to cat_map, exactly in the order a serial run would use.
+
+    Each chunk gets its own IdGenerator, so uniqueness is tracked per chunk
+    and relies on the 92 random bits across chunks. With id_seed the chunk
+    generators are seeded from (id_seed, chunk index): output is
+    reproducible for any worker count, but differs from a serial seeded run.
+    With id_hash=(namespace, secret) and row_keys (see item_row_keys) the
+    chunks use HashIdGenerator instead, and the output is identical to a
+    serial run in "hash" ID mode.
+    At most 2 * workers chunks are in flight at a time. mp_context (e.g.
+    multiprocessing.get_context("spawn")) picks the workers' start method.
+    """
+
+    if items_table is None:
+        items_table = read_items_csv(items_csv_path)
+
+    ctx = _prepare_item_context(items_table["fieldnames"], cata_id, sku_to_options, cat_map, sku_to_images,
+                                image_policy)
+    rows = _table_rows(items_table, ctx["row_fields"])
+    count = items_table["count"]
+    workers = workers or os.cpu_count() or 1
+
+    with _process_pool(workers, mp_context, "_init_item_worker", (ctx, id_seed, id_tracking, id_hash)) as pool:
+        pending = deque()
+        for chunk_index, start in enumerate(range(0, count, chunk_rows)):
+            chunk_keys = None if row_keys is None else row_keys[start:start + chunk_rows]
+            pending.append(pool.submit(_build_item_chunk, chunk_index, start + 1,
+                                       list(islice(rows, chunk_rows)), chunk_keys))
+            while len(pending) >= 2 * workers or (pending and start + chunk_rows >= count):
+                built, issues = pending.popleft().result()
+                _issue_counts.update(issues)
+                for item_doc, cat_key, cat_link in built:
+                    if cat_key is not None:
+                        cat_map[cat_key]["items"].append(cat_link)
+                    yield item_doc
+
+_indent2_encoder = json.JSONEncoder(ensure_ascii=False, indent=2, default=custom_json_encoder)
+_compact_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=custom_json_encoder)
+
+# "auto"   => orjson when it is installed, otherwise the stdlib json encoder
+# "orjson" => orjson, error if it is missing
+# "stdlib" => always the stdlib json encoder
+JSON_BACKENDS = ("auto", "orjson", "stdlib")
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, default=custom_json_encoder).decode("utf-8")
+
+def get_compact_dumps(json_backend="auto"):
+    """
+    Returns a function obj -> compact JSON str (no indentation, tight
+    separators, non-ASCII kept as is). ObjectIds go through
+    custom_json_encoder with either backend.
+    """
+    if json_backend not in JSON_BACKENDS:
+        raise ValueError(f"ERROR: unknown json_backend '{json_backend}'. Use one of {JSON_BACKENDS}.")
+    if json_backend == "orjson" and orjson is None:
+        raise ValueError("ERROR: json_backend='orjson' but orjson is not installed.")
+    if orjson is not None and json_backend != "stdlib":
+        return _orjson_dumps
+    return _compact_encoder.encode
+
+def _write_indented(f, obj, prefix):
+    """
+    Writes obj to f exactly as json.dump(..., indent=2) would render it
+    nested under 'prefix' in a larger indent=2 document. Chunks are written
+    as the encoder produces them, so no full string of obj is ever built.
+    """
+    newline = "\n" + prefix
+    write = f.write
+    for chunk in _indent2_encoder.iterencode(obj):
+        # encoded JSON strings never contain a raw newline, only indentation does
+        write(chunk.replace("\n", newline))
+
+class StreamingJsonWriter:
+    """
+    Writes the final {"items", "catalog", "options"} document incrementally:
+    each item is encoded and written as soon as it is handed over, and the
+    catalog and options are written by close() once all items are done.
+    Only one item is held by the encoder at a time, and the bytes on disk are
+    identical to json.dump(final_json, f, ensure_ascii=False, indent=2).
+
+    With compact_dumps (see get_compact_dumps) the document is written
+    without indentation instead, identical to the compact encoder's output
+    for the whole final_json.
+    """
+
+    def __init__(self, output_json, compact_dumps=None):
+        self._f = open(output_json, "w", encoding="utf-8")
+        self._dumps = compact_dumps
+        self._f.write('{"items":[' if compact_dumps else '{\n  "items": [')
+        self.count = 0
+
+    def write(self, item_doc):
+        if self._dumps:
+            if self.count:
+                self._f.write(",")
+            self._f.write(self._dumps(item_doc))
+        else:
+            self._f.write(",\n    " if self.count else "\n    ")
+            _write_indented(self._f, item_doc, "    ")
+        self.count += 1
+
+    def close(self, cata_obj, options_list):
+        f = self._f
+        if self._dumps:
+            f.write('],"catalog":' + self._dumps(cata_obj) + ',"options":[')
+            for i, opt_doc in enumerate(options_list):
+                if i:
+                    f.write(",")
+                f.write(self._dumps(opt_doc))
+            f.write("]}")
+        else:
+            f.write("\n  ]," if self.count else "],")
+            f.write('\n  "catalog": ')
+            _write_indented(f, cata_obj, "  ")
+            f.write(',\n  "options": ')
+            _write_indented(f, options_list, "  ")
+            f.write("\n}")
+        f.close()
+
+# Item sinks. A sink has write(doc) and close(); iter_items() output can be
+# fed to one or more of them with write_items(). StreamingJsonWriter follows
+# the same write() protocol for the full items/catalog/options document.
+
+class ListSink:
+    """Keeps every item in memory, like items_gen() always did."""
+
+    def __init__(self):
+        self.items = []
+
+    def write(self, item_doc):
+        self.items.append(item_doc)
+
+    def close(self):
+        pass
+
+class JsonArraySink:
+    """Writes the items as one JSON array, same layout as json.dump(items, f, ensure_ascii=False, indent=2)."""
+
+    def __init__(self, output_path):
+        self._f = open(output_path, "w", encoding="utf-8")
+        self._f.write("[")
+        self.count = 0
+
+    def write(self, item_doc):
+        self._f.write(",\n  " if self.count else "\n  ")
+        _write_indented(self._f, item_doc, "  ")
+        self.count += 1
+
+    def close(self):
+        self._f.write("\n]" if self.count else "]")
+        self._f.close()
+
+class NdjsonSink:
+    """Writes one compact JSON document per line (NDJSON / JSON Lines)."""
+
+    def __init__(self, output_path, compact_dumps=None):
+        self._f = open(output_path, "w", encoding="utf-8")
+        self._dumps = compact_dumps or _compact_encoder.encode
+        self.count = 0
+
+    def write(self, item_doc):
+        self._f.write(self._dumps(item_doc))
+        self._f.write("\n")
+        self.count += 1
+
+    def close(self):
+        self._f.close()
+
+# "json"    => one {"items", "catalog", "options"} document (indent=2)
+# "compact" => the same document without indentation or spaces
+# "ndjson"  => one compact document per line, one file per collection
+OUTPUT_FORMATS = ("json", "compact", "ndjson")
+
+def ndjson_output_paths(output_json):
+    """
+    Maps each collection to its NDJSON file, derived from output_json:
+    data/demo_catalog.json => data/demo_catalog.items.ndjson,
+    data/demo_catalog.catalog.ndjson, data/demo_catalog.options.ndjson
+    """
+    base, ext = os.path.splitext(output_json)
+    if ext.lower() not in (".json", ".ndjson", ".jsonl"):
+        base = output_json
+    return {key: f"{base}.{key}.ndjson" for key in ("items", "catalog", "options")}
+
+def write_items(items, *sinks):
+    """
+    Hands every item doc from the 'items' iterable (e.g. iter_items()) to each
+    sink as soon as it is produced. Sinks are left open for the caller to close.
+    Returns the number of items written.
+    """
+    count = 0
+    for item_doc in items:
+        for sink in sinks:
+            sink.write(item_doc)
+        count += 1
+    return count
+
+# Reading builds back. Outputs can be several GB, so they are decoded one
+# document at a time instead of with a single json.load().
+
+_READ_CHUNK_CHARS = 1 << 20
+_json_decoder = json.JSONDecoder()
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+class _JsonStream:
+    """
+    Sliding window over a text file for incremental JSONDecoder.raw_decode().
+    Consumed text is dropped whenever more is read; a value that does not fit
+    the window doubles it, so a huge value costs O(log n) decode attempts.
+    """
+
+    def __init__(self, f, chunk_chars=_READ_CHUNK_CHARS):
+        self._f = f
+        self._chunk_chars = chunk_chars
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self, min_chars=0):
+        if self.eof:
+            return False
+        data = self._f.read(max(self._chunk_chars, min_chars))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace char without consuming it ("" at the end)."""
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._read_more():
+                return ""
+
+    def expect(self, chars):
+        """Consumes the next non-whitespace char, which must be one of 'chars'; returns it."""
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise ValueError(f"ERROR: expected one of {chars!r} in JSON output, found {ch or 'end of file'!r}.")
+        self.pos += 1
+        return ch
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _json_decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._read_more(len(self.buf)):
+                    raise
+                continue
+            # a value ending right at the window edge may be cut short (e.g. a number)
+            if end == len(self.buf) and self._read_more():
+                continue
+            self.pos = end
+            return value
+
+def _iter_top_level_builtin(json_path):
+    with open(json_path, encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            key = stream.decode()
+            stream.expect(":")
+            if stream.peek() == "[":
+                stream.pos += 1
+                yield "array_start", key, None
+                if stream.peek() == "]":
+                    stream.pos += 1
                 else:
-                    fallback_key = (cat_name_str, "Misc")
-                    if fallback_key in cat_map:
-                        cat_map[fallback_key]["items"].append({
-                            "id": {"_id": generate_random_id()},
-                            "item_id": {"_id": item_id}
-                        })
-                    else:
-                        print(f"⚠️ WARNING: (cat_name='{cat_name_str}',sub_cat='{sub_cat_str}') not found. No 'Misc' fallback.")
+                    while True:
+                        yield "member", key, stream.decode()
+                        if stream.expect(",]") == "]":
+                            break
+                yield "array_end", key, None
             else:
-                fallback_key = (cat_name_str, "Misc")
-                if fallback_key in cat_map:
-                    cat_map[fallback_key]["items"].append({
-                        "id": {"_id": generate_random_id()},
-                        "item_id": {"_id": item_id}
-                    })
-                else:
-                    leaf_key = (cat_name_str, "")
-                    if leaf_key in cat_map:
-                        parent_cat = cat_map[leaf_key]
-                        if parent_cat.get("child_category_ids"):
-                            print(f"⚠️ WARNING: Parent cat '{cat_name_str}' has subcats. '{item_id}' not assigned.")
-                        else:
-                            parent_cat["items"].append({
-                                "id": {"_id": generate_random_id()},
-                                "item_id": {"_id": item_id}
-                            })
-                    else:
-                        print(f"❌ ERROR: No matching cat for (cat_name='{cat_name_str}', sub_cat='') => not attached.")
+                yield "value", key, stream.decode()
+            if stream.expect(",}") == "}":
+                break
+
+def _iter_top_level_ijson(json_path):
+    with open(json_path, "rb") as f:
+        key = None
+        builder = None
+        depth = 0
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if builder is None:
+                if prefix == "" and event in ("start_map", "end_map"):
+                    continue
+                if prefix == "" and event == "map_key":
+                    key = value
+                    continue
+                if prefix == key and event == "start_array":
+                    yield "array_start", key, None
+                    continue
+                if prefix == key and event == "end_array":
+                    yield "array_end", key, None
+                    continue
+                builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+            if depth == 0:
+                yield ("member" if prefix != key else "value"), key, builder.value
+                builder = None
+
+# "builtin" => the chunked JSONDecoder.raw_decode reader (_JsonStream)
+# "ijson"   => ijson's event parser, error if it is missing; a little less
+#              memory, but documents are rebuilt event by event in Python,
+#              which is slower than raw_decode even with its C backend
+# "auto"    => builtin
+JSON_READERS = ("auto", "ijson", "builtin")
+
+def iter_top_level(json_path, reader="auto"):
+    """
+    Walks a {"items": [...], "catalog": {...}, "options": [...]} file written
+    by main() (json or compact format) without loading it whole. Yields
+    (event, key, doc) tuples: ("array_start", key, None), ("member", key, doc)
+    for each array member, ("array_end", key, None), and ("value", key, doc)
+    for top-level values that are not arrays. Only one document is decoded
+    at a time; 'reader' is one of JSON_READERS.
+    """
+    if reader not in JSON_READERS:
+        raise ValueError(f"ERROR: unknown reader '{reader}'. Use one of {JSON_READERS}.")
+    if reader == "ijson" and ijson is None:
+        raise ValueError("ERROR: reader='ijson' but ijson is not installed.")
+    if reader == "ijson":
+        return _iter_top_level_ijson(json_path)
+    return _iter_top_level_builtin(json_path)
+
+def iter_json_documents(json_path, reader="auto"):
+    """
+    Yields (key, doc) for a file written by main() (json or compact format):
+    array members one by one, other top-level values whole (see iter_top_level).
+    """
+    for event, key, doc in iter_top_level(json_path, reader):
+        if event in ("member", "value"):
+            yield key, doc
 
-            items.append(item_doc)
+def iter_build_documents(output_json, output_format=None):
+    """
+    Yields (collection, doc) for every document of a build written by main()
+    to output_json, in file order. output_format (see OUTPUT_FORMATS) is
+    detected when not given: output_json itself if it exists, otherwise the
+    NDJSON files next to it (see ndjson_output_paths).
+    """
+    if output_format is None:
+        output_format = "json" if os.path.exists(output_json) else "ndjson"
+    if output_format != "ndjson":
+        yield from iter_json_documents(output_json)
+        return
+    for collection, path in ndjson_output_paths(output_json).items():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield collection, _json_loads(line)
+
+# Build diffs. A patch is an NDJSON file with one operation per line:
+#   {"op": "add",    "collection": ..., "id": ..., "doc": {...}}
+#   {"op": "change", "collection": ..., "id": ..., "doc": {...}}   (+ "replaces": old id)
+#   {"op": "remove", "collection": ..., "id": ...}
+# Documents are matched on their $oid; items whose $oid is new are also
+# matched on merchant_sku, so random-ID rebuilds patch items instead of
+# removing and re-adding them. The catalog is a single document.
+
+def patch_output_path(output_json):
+    """data/demo_catalog.json => data/demo_catalog.patch.ndjson"""
+    base, ext = os.path.splitext(output_json)
+    if ext.lower() not in (".json", ".ndjson", ".jsonl"):
+        base = output_json
+    return f"{base}.patch.ndjson"
+
+def _doc_oid(collection, doc):
+    if collection == "catalog":
+        return None
+    oid = doc.get("$oid")
+    return oid.get("_id") if isinstance(oid, dict) else None
+
+def diff_builds(old_output, new_output, patch_path, json_backend="auto", old_format=None, new_format=None):
+    """
+    Compares the build at new_output with the previous one at old_output
+    (see iter_build_documents) and writes only the added, changed and
+    removed documents to patch_path. Both builds are streamed: the previous
+    one is reduced to one 16-byte digest per document, the new one is
+    compared and written out document by document.
+    Returns a Counter of the operations written and the unchanged documents.
+    """
+    dumps = get_compact_dumps(json_backend)
+
+    def digest(doc):
+        return hashlib.blake2b(dumps(doc).encode("utf-8"), digest_size=16).digest()
+
+    old_digests = defaultdict(dict)  # collection -> {$oid: digest}
+    old_item_by_sku = {}             # merchant_sku -> item $oid
+    for collection, doc in iter_build_documents(old_output, old_format):
+        oid = _doc_oid(collection, doc)
+        old_digests[collection][oid] = digest(doc)
+        if collection == "items" and doc.get("merchant_sku"):
+            old_item_by_sku.setdefault(doc["merchant_sku"], oid)
+
+    counts = Counter()
+    with open(patch_path, "w", encoding="utf-8") as f:
+        for collection, doc in iter_build_documents(new_output, new_format):
+            oid = _doc_oid(collection, doc)
+            old = old_digests[collection]
+            old_oid = oid
+            old_digest = old.pop(oid, None)
+            if old_digest is None and collection == "items":
+                old_oid = old_item_by_sku.get(doc.get("merchant_sku"))
+                old_digest = old.pop(old_oid, None)
+
+            if old_digest is None:
+                op = {"op": "add", "collection": collection, "id": oid, "doc": doc}
+            elif old_digest != digest(doc):
+                op = {"op": "change", "collection": collection, "id": oid, "doc": doc}
+                if old_oid != oid:
+                    op["replaces"] = old_oid
+            else:
+                counts["unchanged"] += 1
+                continue
+            f.write(dumps(op))
+            f.write("\n")
+            counts[op["op"]] += 1
 
-    return items
+        for collection, old in old_digests.items():
+            for oid in old:
+                f.write(dumps({"op": "remove", "collection": collection, "id": oid}))
+                f.write("\n")
+                counts["remove"] += 1
+    return counts
 
 def strip_images(json_data):
     """
     Recursively remove or neutralize all image fields:
       - If 'image_blur' or 'hash' is found, delete it.
-      - If 'image' is found, set it to "" (empty string).
+      - If 'image' is found, delete it.
       - If 'images' is found, set it to [] (empty list).
     Works on both categories (which typically have 'image', 'image_blur')
     and items (which may have 'image', 'images', 'image_blur'), etc.
+    Dicts are changed in place and no list is rebuilt; returns json_data.
+    For documents built by this script, apply_image_policy() does the same
+    by visiting only the places images can be.
     """
-
     if isinstance(json_data, dict):
         if "image_blur" in json_data:
             del json_data["image_blur"]
@@ -584,40 +1817,146 @@ def strip_images(json_data):
             del json_data["image"]
         if "images" in json_data:
             json_data["images"] = []
-        for key, value in list(json_data.items()):
-            json_data[key] = strip_images(value)
+        for value in json_data.values():
+            if isinstance(value, (dict, list)):
+                strip_images(value)
 
     elif isinstance(json_data, list):
-        return [strip_images(item) for item in json_data]
+        for value in json_data:
+            if isinstance(value, (dict, list)):
+                strip_images(value)
     return json_data
 
+# What to do with images, at build time (main(image_policy=...)) or on a
+# finished build (apply_image_policy):
+# "keep"  => items and categories keep their images
+# "strip" => same as strip_images(): image/image_blur removed, images = []
+# "empty" => same as force_no_images(): image = image_blur = "", images = []
+IMAGE_POLICIES = ("keep", "strip", "empty")
+
+def apply_item_image_policy(item_doc, image_policy):
+    """Applies image_policy to one item doc in place."""
+    if image_policy == "strip":
+        item_doc.pop("image", None)
+        item_doc.pop("image_blur", None)
+        if "images" in item_doc:
+            item_doc["images"] = []
+    elif image_policy == "empty":
+        item_doc["image"] = ""
+        item_doc["image_blur"] = ""
+        item_doc["images"] = []
+
+def apply_category_image_policy(cata_obj, image_policy):
+    """Applies image_policy to every category of cata_obj in place."""
+    if image_policy == "keep":
+        return
+    for cat in cata_obj["categories"]:
+        if image_policy == "strip":
+            cat.pop("image", None)
+            cat.pop("image_blur", None)
+        else:
+            cat["image"] = ""
+            cat["image_blur"] = ""
 
-def remove_images_in_json_file(input_path, output_path):
+def apply_image_policy(final_json, image_policy):
+    """
+    Applies image_policy in place to a {"items", "catalog", "options"}
+    document built by this script. Only items and categories carry images,
+    so only they are visited; nothing is copied. Returns final_json.
+    """
+    if image_policy not in IMAGE_POLICIES:
+        raise ValueError(f"ERROR: unknown image_policy '{image_policy}'. Use one of {IMAGE_POLICIES}.")
+    if image_policy != "keep":
+        for item_doc in final_json.get("items", []):
+            apply_item_image_policy(item_doc, image_policy)
+        if "catalog" in final_json:
+            apply_category_image_policy(final_json["catalog"], image_policy)
+    return final_json
+
+def _top_level_is_object(json_path):
+    """Whether the JSON document in json_path starts with '{'."""
+    with open(json_path, encoding="utf-8") as f:
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return False
+            stripped = chunk.lstrip()
+            if stripped:
+                return stripped[0] == "{"
+
+def remove_images_in_json_file(input_path, output_path, stream=False, reader="auto"):
     """
     Reads a JSON file, runs 'strip_images' to remove all
     references to images, then writes the cleaned JSON.
+    With stream=True a top-level object (e.g. what main() writes, see
+    iter_top_level) is cleaned and written one top-level value or array
+    member at a time, so memory stays flat whatever the file size, and the
+    output is byte for byte what stream=False (json.load + json.dump)
+    writes. Any other input falls back to stream=False.
     """
-    with open(input_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    if stream and not _top_level_is_object(input_path):
+        stream = False
+    if not stream:
+        with open(input_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        cleaned = strip_images(data)
+
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(cleaned, f, ensure_ascii=False, indent=2)
 
-    cleaned = strip_images(data)
+        logger.info("✅ Cleaned JSON saved to %s", output_path)
+        return
 
     with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(cleaned, f, ensure_ascii=False, indent=2)
+        write = f.write
+        keys_written = 0
+        members = 0
+
+        def start_key(key):
+            nonlocal keys_written
+            write(",\n  " if keys_written else "{\n  ")
+            write(json.dumps(key, ensure_ascii=False) + ": ")
+            keys_written += 1
+
+        for event, key, doc in iter_top_level(input_path, reader):
+            # the top-level object gets the same treatment strip_images() gives every dict
+            if key in ("image_blur", "hash", "image"):
+                continue
+            if key == "images":
+                if event in ("array_start", "value"):
+                    start_key(key)
+                    write("[]")
+                continue
+            if event == "value":
+                start_key(key)
+                _write_indented(f, strip_images(doc), "  ")
+            elif event == "array_start":
+                start_key(key)
+                write("[")
+                members = 0
+            elif event == "member":
+                write(",\n    " if members else "\n    ")
+                _write_indented(f, strip_images(doc), "    ")
+                members += 1
+            else:
+                write("\n  ]" if members else "]")
+        write("\n}" if keys_written else "{}")
 
-    print(f"✅ Cleaned JSON saved to {output_path}")
+    logger.info("✅ Cleaned JSON saved to %s", output_path)
 
-def move_parent_items_to_misc(cata_obj):
+def move_parent_items_to_misc(cata_obj, stats=None):
     """
     After the catalog is built, some parent categories (with subcategories) may still have 'items'.
     This function scans them, finds their 'Misc' subcategory, and moves all items there.
     
     If no 'Misc' subcategory is found, it logs a warning and leaves them.
+    If a stats Counter is given, the number of moved items is added to it.
     Returns the modified cata_obj for convenience.
     """
     
     if "categories" not in cata_obj:
-        print("WARNING: No 'categories' found with something something in cata_obj. do nothing.")
+        _log_warning("WARNING: No 'categories' found with something something in cata_obj. do nothing.")
         return cata_obj
     cat_lookup = {}
     for cat in cata_obj["categories"]:
@@ -626,9 +1965,9 @@ def move_parent_items_to_misc(cata_obj):
     for cat in cata_obj["categories"]:
         cat_id = cat["id"]["_id"]
         cat_name = cat["name"][0]["value"] if cat.get("name") else "Unknown"
-        print(f"\n[DEBUG] Checking category since it has something something while '{cat_name}' (ID={cat_id})")
-        print(f"        child_category_ids={cat.get('child_category_ids', [])}")
-        print(f"        items={cat.get('items', [])}")
+        logger.debug("Checking category since it has something something while '%s' (ID=%s) "
+                     "child_category_ids=%s items=%s",
+                     cat_name, cat_id, cat.get('child_category_ids', []), cat.get('items', []))
 
         if cat.get("child_category_ids") and cat.get("items"):
             items_to_move = cat["items"]
@@ -641,17 +1980,24 @@ def move_parent_items_to_misc(cata_obj):
                     misc_cat = child_cat
                     break
             if misc_cat:
-                print(f"[DEBUG]  --> FOUND 'Misc' subcat for '{cat_name}' (ID={cat_id}). Moving {len(items_to_move)} items now...")
+                logger.debug("  --> FOUND 'Misc' subcat for '%s' (ID=%s). Moving %d items now...",
+                             cat_name, cat_id, len(items_to_move))
                 misc_cat["items"].extend(items_to_move)
                 cat["items"] = []
-                print(f"[DEBUG]  --> DONE: Moved items to 'Misc'. Parent now has items={cat['items']}")
+                if stats is not None:
+                    stats["items_moved_to_misc"] += len(items_to_move)
             else:
-                print(f"⚠️ WARNING: Parent category '{cat_name}' ({cat_id}) has subcategories "
-                      f"but no 'Misc' child found. Items remain here = {len(items_to_move)}")
+                _log_warning("⚠️ WARNING: Parent category '%s' (%s) has subcategories "
+                             "but no 'Misc' child found. Items remain here = %d", cat_name, cat_id, len(items_to_move))
 
     return cata_obj
 
-def check_for_parent_items(catalog):
+def check_for_parent_items(catalog, stats=None):
+    """
+    Logs every parent category that still holds items (warning level);
+    per-category "OK" lines are only logged at debug level.
+    If a stats Counter is given, checked categories and offenders are counted.
+    """
 
     found_issues = False 
     for cat in catalog["categories"]:
@@ -662,15 +2008,19 @@ def check_for_parent_items(catalog):
 
         if child_ids:
             if items:
-                print(f"🚨 PARENT CATEGORY '{cat_name}' ({cat_id}) still has {len(items)} items!")
+                _log_warning("🚨 PARENT CATEGORY '%s' (%s) still has %d items!", cat_name, cat_id, len(items))
                 found_issues = True
+                if stats is not None:
+                    stats["parent_categories_with_items"] += 1
             else:
-                print(f"✅ Parent category '{cat_name}' ({cat_id}) has no items. (Correct)")
+                logger.debug("✅ Parent category '%s' (%s) has no items. (Correct)", cat_name, cat_id)
         else:
-            print(f"✅ Leaf category '{cat_name}' ({cat_id}) is allowed to have items.")
+            logger.debug("✅ Leaf category '%s' (%s) is allowed to have items.", cat_name, cat_id)
 
+    if stats is not None:
+        stats["categories_checked"] += len(catalog["categories"])
     if not found_issues:
-        print("🎉 SUCCESS: No parent categories contain items!")
+        logger.info("🎉 SUCCESS: No parent categories contain items!")
 
 def parse_images_csv(images_csv_path):
     """
@@ -695,7 +2045,8 @@ def parse_images_csv(images_csv_path):
             image_url = row["image_url"].strip()
             
             if not merchant_sku or not image_url:
-                print(f"Warning: row with empty has something something merchant_sku='{merchant_sku}' or image_url='{image_url}'. Skipping.")
+                _log_warning("Warning: row with empty has something something merchant_sku='%s' or image_url='%s'. Skipping.",
+                             merchant_sku, image_url)
                 continue
 
             sku_to_images[merchant_sku].append(image_url)
@@ -709,6 +2060,9 @@ def force_no_images(json_data):
       "image_blur" => "",
       "images" => []
     in all dictionaries/lists of the final JSON.
+    Dicts are changed in place and no list is rebuilt; returns json_data.
+    For documents built by this script, apply_image_policy(json_data, "empty")
+    does the same by visiting only the places images can be.
     """
     if isinstance(json_data, dict):
         if "image" in json_data:
@@ -718,91 +2072,553 @@ def force_no_images(json_data):
         if "images" in json_data:
             json_data["images"] = []
 
-        for key, value in json_data.items():
-            json_data[key] = force_no_images(value)
+        for value in json_data.values():
+            if isinstance(value, (dict, list)):
+                force_no_images(value)
 
     elif isinstance(json_data, list):
-        return [force_no_images(item) for item in json_data]
+        for value in json_data:
+            if isinstance(value, (dict, list)):
+                force_no_images(value)
 
     return json_data
 
-def assign_category_images(cata_obj, items_list):
+def item_image_url(item_doc):
+    """The image a category would borrow from this item: its first 'images' url, else 'image'."""
+    if item_doc.get("images"):
+        return item_doc["images"][0].get("url", "")
+    return item_doc.get("image", "")
+
+def index_item_images(items, image_index=None):
+    """
+    Builds (or extends) a dict: item_id -> image url, for the items that
+    actually have an image. This is all assign_category_images() needs, so
+    the item docs themselves do not have to stay in memory.
+    """
+    if image_index is None:
+        image_index = {}
+    for item_doc in items:
+        url = item_image_url(item_doc)
+        if url:
+            image_index[item_doc["$oid"]["_id"]] = url
+    return image_index
+
+def assign_category_images(cata_obj, image_index, image_policy="keep"):
     """
     For each category in cata_obj['categories'],
-    find the "first" item (BFS or DFS),
+    find the "first" item (its own first item, else the first one found
+    depth-first through its child categories),
     copy that item’s first image => category.image (and set image_blur="").
+
+    image_index comes from index_item_images(). Each category's first item
+    is computed once and memoized, so the whole pass is
+    O(categories + category links).
+    With any other image_policy than "keep" (see IMAGE_POLICIES) no image is
+    looked up and the policy is applied to the categories instead.
     """
-    item_map = {}
-    for it in items_list:
-        it_id = it["$oid"]["_id"]
-        item_map[it_id] = it
+    if image_policy != "keep":
+        apply_category_image_policy(cata_obj, image_policy)
+        return
+
     cat_lookup = {}
     for cat in cata_obj["categories"]:
         cid = cat["id"]["_id"]
         cat_lookup[cid] = cat
+
+    first_item_ids = {}  # cat_id -> first item_id or None
+
     def find_first_item_id(cat_id):
+        if cat_id in first_item_ids:
+            return first_item_ids[cat_id]
+        first_item_ids[cat_id] = None  # guards against cycles in malformed trees
         cat_obj = cat_lookup[cat_id]
-        if "items" in cat_obj and cat_obj["items"]:
-            return cat_obj["items"][0]["item_id"]["_id"]
-        for child_cat_id_obj in cat_obj.get("child_category_ids", []):
-            child_id = child_cat_id_obj["_id"]
-            found = find_first_item_id(child_id)
-            if found:
-                return found
-        return None  # no items found
-
-    for cat in cata_obj["categories"]:
-        cat_id = cat["id"]["_id"]
-        item_id = find_first_item_id(cat_id)
-        if item_id and item_id in item_map:
-            item_doc = item_map[item_id]
-            if item_doc.get("images"):
-                cat["image"] = item_doc["images"][0].get("url", "")
-                cat["image_blur"] = ""
-            else:
-                cat["image"] = item_doc.get("image", "")
-                cat["image_blur"] = ""
+        found = None
+        if cat_obj.get("items"):
+            found = cat_obj["items"][0]["item_id"]["_id"]
         else:
-            cat["image"] = ""
-            cat["image_blur"] = ""
+            for child_cat_id_obj in cat_obj.get("child_category_ids", []):
+                found = find_first_item_id(child_cat_id_obj["_id"])
+                if found:
+                    break
+        first_item_ids[cat_id] = found
+        return found
 
-    print("✅ Done assigning category images from the first item found.")
+    for cat in cata_obj["categories"]:
+        item_id = find_first_item_id(cat["id"]["_id"])
+        cat["image"] = image_index.get(item_id, "") if item_id else ""
+        cat["image_blur"] = ""
 
-def main(items_csv, options_csv, images_csv, output_json):
+    logger.info("✅ Done assigning category images from the first item found.")
 
-    cata_obj, cat_map = cats_gen(items_csv)
-    cata_id = cata_obj["$oid"]["_id"]
-    options_list = opts_gen(options_csv, cata_id)
-    sku_to_images = parse_images_csv(images_csv)
-    items_list = items_gen(items_csv, cata_id, options_list, cat_map, sku_to_images)
-    cata_obj = assign_category_images(cata_obj)
-    move_parent_items_to_misc(cata_obj, items_list)
-    check_for_parent_items(cata_obj)
+class BuildProfile:
+    """
+    Records wall time, CPU time, peak traced memory (tracemalloc) and a
+    row/document count for each stage of a build.
+
+        profile = BuildProfile()
+        with profile.stage("items_gen") as rec:
+            items = items_gen(...)
+            rec["count"] = len(items)
+        logger.info("%s", profile.table())
+
+    With enabled=False stage() does no timing at all and nothing is
+    recorded, so a disabled profile can be left in place. Memory tracing
+    slows Python code down noticeably; pass trace_memory=False to keep
+    only the timings.
+    """
 
-    final_json = {
-        "items": items_list,
-        "catalog": cata_obj,
-        "options": options_list
-    }
+    def __init__(self, enabled=True, trace_memory=True):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield {}
+            return
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+        record = {"stage": name, "count": None}
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = round(time.perf_counter() - wall_start, 4)
+            record["cpu_s"] = round(time.process_time() - cpu_start, 4)
+            if self.trace_memory:
+                record["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+            self.stages.append(record)
+
+    def stop(self):
+        """Stops tracemalloc if this profile started it."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def to_dict(self):
+        return {
+            "stages": self.stages,
+            "total_wall_s": round(sum(r["wall_s"] for r in self.stages), 4),
+            "total_cpu_s": round(sum(r["cpu_s"] for r in self.stages), 4),
+        }
 
-    # (OPTIONALLY) if you do not want to remove images, do not call force_no_images
-    # instead, if you do want to force-remove or empty them => skip or do remove_images_in_json_file if you want.
+    def save_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def table(self):
+        """The recorded stages as a plain-text table."""
+        lines = [f"{'stage':<26}{'wall s':>10}{'cpu s':>10}{'peak MB':>10}{'count':>12}"]
+        for r in self.stages:
+            peak = r.get("peak_traced_mb")
+            lines.append(f"{r['stage']:<26}{r['wall_s']:>10.3f}{r['cpu_s']:>10.3f}"
+                         f"{'-' if peak is None else f'{peak:.1f}':>10}"
+                         f"{'-' if r['count'] is None else r['count']:>12}")
+        totals = self.to_dict()
+        lines.append(f"{'total':<26}{totals['total_wall_s']:>10.3f}{totals['total_cpu_s']:>10.3f}")
+        return "\n".join(lines)
+
+def main(items_csv, options_csv, images_csv, output_json, id_seed=None, id_tracking="compact", stream=False,
+         output_format="json", json_backend="auto", workers=None, profile=False, profile_json=None,
+         manifest_path=None, id_mode="random", id_namespace="", id_secret=None, diff_from=None,
+         image_policy="keep", dedup_options=False, validate=True, validation_report=None):
+    """
+    Builds the final JSON (items, catalog, options) from the three CSV files.
+    Pass id_seed to get reproducible IDs across runs; id_tracking picks
+    one of ID_TRACKING_MODES. Each call installs a fresh IdGenerator and
+    restores the previous one when it returns, so issued IDs are only
+    tracked for the duration of one build.
+    With stream=True items are written to output_json as they are built
+    (see StreamingJsonWriter) instead of being collected in memory first.
+    output_format="ndjson" writes items, catalog and options as NDJSON files
+    next to output_json (see ndjson_output_paths); it always streams.
+    output_format="compact" and "ndjson" use the encoder picked by
+    json_backend (see JSON_BACKENDS); "json" always uses the stdlib.
+    workers > 1 builds the items in that many processes (see iter_items_parallel).
+    Diagnostics go to the "json_builder" logger; a summary of the build's
+    counters is logged at the end and also returned as a Counter.
+    profile=True logs a per-stage timing/memory table (see BuildProfile),
+    profile="time" skips the (slow) memory tracing; profile_json also saves
+    the table to that path as JSON.
+    manifest_path enables incremental rebuilds: IDs issued for the same
+    catalog, categories, options and items.csv rows (keyed by merchant_sku)
+    by the previous build are reused, so unchanged rows produce identical
+    docs; the manifest is rewritten after a successful build and the
+    rows added/changed/unchanged/removed are counted in the summary.
+    id_mode="hash" derives every ID from its business keys instead (see
+    HashIdGenerator, keyed with id_namespace and id_secret): the same CSVs
+    always give the same output, with any number of workers. id_namespace
+    defaults to the catalog name, output_json's file name without its
+    extension, so two catalogs never share IDs.
+    diff_from names a previous build's output_json: once this build is
+    written, only its added/changed/removed documents are also written to
+    patch_output_path(output_json) (see diff_builds).
+    image_policy="strip" or "empty" (see IMAGE_POLICIES) leaves images out
+    while items and categories are built, instead of a strip_images() or
+    force_no_images() pass over the finished JSON; images.csv is not read.
+    dedup_options=True emits one shared option doc per distinct option group
+    instead of one per SKU (see opts_gen).
+    validate=True checks the three CSVs with validate_inputs() (items.csv
+    from the already loaded table) and raises a ValueError before anything
+    is built if they have errors; validation_report saves its report as JSON.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"ERROR: unknown output_format '{output_format}'. Use one of {OUTPUT_FORMATS}.")
+    if manifest_path and workers and workers > 1:
+        raise ValueError("ERROR: manifest_path needs the single-process item builder; drop workers.")
+    if id_mode not in ID_MODES:
+        raise ValueError(f"ERROR: unknown id_mode '{id_mode}'. Use one of {ID_MODES}.")
+    if image_policy not in IMAGE_POLICIES:
+        raise ValueError(f"ERROR: unknown image_policy '{image_policy}'. Use one of {IMAGE_POLICIES}.")
+    if diff_from and os.path.abspath(diff_from) == os.path.abspath(output_json):
+        raise ValueError("ERROR: diff_from must not be output_json, it would be overwritten before the diff.")
+    compact_dumps = get_compact_dumps(json_backend) if output_format != "json" else None
+
+    if id_mode == "hash" and not id_namespace:
+        # the catalog name: without it, two feeds would share catalog, category and option IDs
+        id_namespace = os.path.splitext(os.path.basename(output_json))[0]
+    id_hash = (id_namespace, id_secret) if id_mode == "hash" else None
+    if id_hash is not None:
+        id_generator = HashIdGenerator(*id_hash)
+    else:
+        id_generator = IdGenerator(seed=id_seed, tracking=id_tracking)
+    manifest = None
+    if manifest_path:
+        manifest = load_manifest(manifest_path)
+        id_generator = ManifestIdGenerator(manifest["ids"], id_generator)
+    # restored when the build ends, so its ID bookkeeping is freed with it
+    previous_generator = set_id_generator(id_generator)
+    clear_localized_cache()
+    stats = Counter()
+    issues_before = _issue_counts.copy()
+
+    profile = BuildProfile(enabled=bool(profile or profile_json), trace_memory=profile != "time")
+    try:
+        # items.csv is decoded once and shared by the validation, category and item stages
+        with profile.stage("read_items_csv") as rec:
+            items_table = read_items_csv(items_csv, raise_errors=not validate)
+            rec["count"] = items_table["count"]
+        if validate:
+            with profile.stage("validate") as rec:
+                report = validate_inputs(items_csv, options_csv, images_csv if image_policy == "keep" else None,
+                                         report_json=validation_report, items_table=items_table)
+                rec["count"] = sum(result["rows"] for result in report["files"].values())
+            if not report["valid"]:
+                raise ValueError(f"ERROR: the input CSVs have {report['errors']} errors (see above). Build skipped.")
+        row_keys = None
+        if manifest is not None or id_hash is not None:
+            with profile.stage("hash rows") as rec:
+                row_keys, row_hashes = item_row_keys(items_table)
+                if manifest is not None:
+                    stats.update(diff_row_hashes(manifest["row_hashes"], row_hashes))
+                rec["count"] = len(row_keys)
+        with profile.stage("cats_gen") as rec:
+            cata_obj, cat_map = cats_gen(items_csv, items_table, stats)
+            rec["count"] = len(cata_obj["categories"])
+        cata_id = cata_obj["$oid"]["_id"]
+        with profile.stage("opts_gen") as rec:
+            options_list, sku_to_options = opts_gen(options_csv, cata_id, dedup=dedup_options)
+            rec["count"] = len(options_list)
+        sku_to_images = {}
+        if image_policy == "keep":
+            with profile.stage("parse_images_csv") as rec:
+                sku_to_images = parse_images_csv(images_csv)
+                rec["count"] = len(sku_to_images)
+        stats["options"] = len(options_list)
+
+        if workers and workers > 1:
+            item_iter = iter_items_parallel(items_csv, cata_id, sku_to_options, cat_map, sku_to_images, items_table,
+                                            workers=workers, id_seed=id_seed, id_tracking=id_tracking,
+                                            row_keys=row_keys, id_hash=id_hash, image_policy=image_policy)
+        else:
+            item_iter = iter_items(items_csv, cata_id, sku_to_options, cat_map, sku_to_images, items_table, row_keys,
+                                   image_policy)
+
+        if stream or output_format == "ndjson":
+            # items go straight to disk; only the IDs of items with an image are
+            # kept, for assign_category_images()
+            if output_format == "ndjson":
+                ndjson_paths = ndjson_output_paths(output_json)
+                item_sink = NdjsonSink(ndjson_paths["items"], compact_dumps)
+            else:
+                item_sink = StreamingJsonWriter(output_json, compact_dumps)
+            image_index = {}
+            with profile.stage("items_gen + write") as rec:
+                for item_doc in item_iter:
+                    item_sink.write(item_doc)
+                    url = item_image_url(item_doc)
+                    if url:
+                        image_index[item_doc["$oid"]["_id"]] = url
+                rec["count"] = item_sink.count
+            stats["items"] = item_sink.count
+            with profile.stage("assign_category_images") as rec:
+                assign_category_images(cata_obj, image_index, image_policy)
+                rec["count"] = len(cata_obj["categories"])
+            with profile.stage("check categories") as rec:
+                move_parent_items_to_misc(cata_obj, stats)
+                check_for_parent_items(cata_obj, stats)
+                rec["count"] = len(cata_obj["categories"])
+
+            with profile.stage("write catalog + options") as rec:
+                if output_format == "ndjson":
+                    item_sink.close()
+                    for key, docs in (("catalog", [cata_obj]), ("options", options_list)):
+                        sink = NdjsonSink(ndjson_paths[key], compact_dumps)
+                        write_items(docs, sink)
+                        sink.close()
+                else:
+                    item_sink.close(cata_obj, options_list)
+                rec["count"] = 1 + len(options_list)
+            if output_format == "ndjson":
+                logger.info("✅ Final NDJSON => %s", ", ".join(ndjson_paths.values()))
+            else:
+                logger.info("✅ Final JSON => %s", output_json)
+        else:
+            with profile.stage("items_gen") as rec:
+                items_list = list(item_iter)
+                rec["count"] = len(items_list)
+            stats["items"] = len(items_list)
+            with profile.stage("assign_category_images") as rec:
+                assign_category_images(cata_obj, index_item_images(items_list), image_policy)
+                rec["count"] = len(cata_obj["categories"])
+            with profile.stage("check categories") as rec:
+                move_parent_items_to_misc(cata_obj, stats)
+                check_for_parent_items(cata_obj, stats)
+                rec["count"] = len(cata_obj["categories"])
+
+            final_json = {
+                "items": items_list,
+                "catalog": cata_obj,
+                "options": options_list
+            }
 
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(final_json, f, ensure_ascii=False, indent=2)
+            # (OPTIONALLY) to drop images, build with image_policy="strip" or "empty" instead of
+            # calling strip_images / force_no_images (or remove_images_in_json_file) afterwards.
 
-    print(f"✅ Final JSON => {output_json}")
+            with profile.stage("dump") as rec:
+                with open(output_json, "w", encoding="utf-8") as f:
+                    if compact_dumps:
+                        f.write(compact_dumps(final_json))
+                    else:
+                        json.dump(final_json, f, ensure_ascii=False, indent=2, default=custom_json_encoder)
+                rec["count"] = len(items_list) + 1 + len(options_list)
+
+            logger.info("✅ Final JSON => %s", output_json)
+
+        if manifest is not None:
+            save_manifest(manifest_path, id_generator.issued, row_hashes)
+            stats["ids_reused"] = id_generator.reused
+            logger.info("🧾 Manifest => %s (%d rows added, %d changed, %d unchanged, %d removed; %d IDs reused)",
+                        manifest_path, stats["rows_added"], stats["rows_changed"], stats["rows_unchanged"],
+                        stats["rows_removed"], stats["ids_reused"])
+
+        if diff_from:
+            patch_path = patch_output_path(output_json)
+            with profile.stage("diff") as rec:
+                patch_counts = diff_builds(diff_from, output_json, patch_path, json_backend,
+                                           new_format="ndjson" if output_format == "ndjson" else "json")
+                rec["count"] = sum(patch_counts.values())
+            for op in ("add", "change", "remove", "unchanged"):
+                stats[f"patch_{op}"] = patch_counts[op]
+            logger.info("🩹 Patch => %s (%d added, %d changed, %d removed, %d unchanged)", patch_path,
+                        patch_counts["add"], patch_counts["change"], patch_counts["remove"], patch_counts["unchanged"])
+
+        if profile.enabled:
+            profile.stop()
+            logger.info("⏱️ Stage profile:\n%s", profile.table())
+            if profile_json:
+                profile.save_json(profile_json)
+                logger.info("⏱️ Stage profile saved to %s", profile_json)
+
+        issues = _issue_counts - issues_before
+        stats["warnings"] = issues["warnings"]
+        stats["errors"] = issues["errors"]
+        log_build_summary(stats)
+        return stats
+    finally:
+        # also on failures, so a failed build never leaves tracemalloc running
+        # or the interned names and issued IDs alive in a batch worker
+        profile.stop()
+        clear_localized_cache()
+        set_id_generator(previous_generator)
+
+def log_build_summary(stats):
+    """Logs the counters main() collected during one build as a single report."""
+    logger.info("📊 Build summary: %d items, %d options, %d categories checked, "
+                "%d 'Misc' subcategories created, %d items moved to 'Misc', "
+                "%d parent categories still with items, %d warnings, %d errors",
+                stats["items"], stats["options"], stats["categories_checked"],
+                stats["misc_categories"], stats["items_moved_to_misc"], stats["parent_categories_with_items"],
+                stats["warnings"], stats["errors"])
+
+# the input set of one venue, i.e. one catalog
+VENUE_INPUTS = ("items.csv", "options.csv", "images.csv")
+
+def discover_venues(venues_dir, output_dir=None):
+    """
+    Finds the venues under venues_dir: every subdirectory holding any of
+    VENUE_INPUTS is one venue, named after the directory. Returns a list of
+    venue dicts (name, items_csv, options_csv, images_csv, output_json),
+    sorted by name. output_json is <name>.json in output_dir if given,
+    otherwise next to the venue's CSVs. A venue that lacks some of the
+    inputs also has "missing" (the file names); build_venues() reports it
+    as failed. Subdirectories without any input are skipped with a warning.
+    """
+    venues = []
+    for name in sorted(os.listdir(venues_dir)):
+        venue_dir = os.path.join(venues_dir, name)
+        if not os.path.isdir(venue_dir):
+            continue
+        missing = [f for f in VENUE_INPUTS if not os.path.isfile(os.path.join(venue_dir, f))]
+        if len(missing) == len(VENUE_INPUTS):
+            _log_warning("⚠️ Skipping %s: none of %s found.", venue_dir, ", ".join(VENUE_INPUTS))
+            continue
+        if missing:
+            _log_warning("⚠️ Venue '%s' is missing %s.", name, ", ".join(missing))
+        venue = {
+            "name": name,
+            "items_csv": os.path.join(venue_dir, "items.csv"),
+            "options_csv": os.path.join(venue_dir, "options.csv"),
+            "images_csv": os.path.join(venue_dir, "images.csv"),
+            "output_json": os.path.join(output_dir or venue_dir, f"{name}.json"),
+        }
+        if missing:
+            venue["missing"] = missing
+        venues.append(venue)
+    return venues
+
+def _build_venue(venue, main_kwargs):
+    """Runs main() for one venue; failures are reported in the result instead of raised."""
+    result = {"venue": venue["name"], "output_json": venue["output_json"], "ok": False}
+    start = time.perf_counter()
+    if venue.get("missing"):
+        result["error"] = f"missing {', '.join(venue['missing'])}"
+        result["wall_s"] = 0.0
+        return result
+    try:
+        stats = main(venue["items_csv"], venue["options_csv"], venue["images_csv"], venue["output_json"],
+                     **main_kwargs)
+    except Exception as e:
+        logger.exception("❌ Venue '%s' failed", venue["name"])
+        result["error"] = f"{type(e).__name__}: {e}"
+    else:
+        result["ok"] = True
+        for key in ("items", "options", "warnings", "errors"):
+            result[key] = stats[key]
+    result["wall_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+def _venue_main_kwargs(venue, main_kwargs):
+    # per-venue ID state: main() installs a fresh generator for every build;
+    # seeds and hash namespaces are derived from the venue name as well, so
+    # two venues never share a seeded ID sequence or hashed IDs
+    kwargs = dict(main_kwargs)
+    if kwargs.get("id_seed") is not None:
+        kwargs["id_seed"] = f"{kwargs['id_seed']}:{venue['name']}"
+    namespace = kwargs.get("id_namespace")
+    kwargs["id_namespace"] = f"{namespace}:{venue['name']}" if namespace else venue["name"]
+    return kwargs
+
+def build_venues(venues, workers=None, report_json=None, mp_context=None, **main_kwargs):
+    """
+    Builds many venues (e.g. from discover_venues) in one interpreter:
+    main() runs for each venue on a ProcessPoolExecutor of 'workers'
+    processes (default: one per CPU; workers=1 builds them in turn in this
+    process; mp_context picks their start method, see iter_items_parallel).
+    main_kwargs are passed to every main() call.
+
+    A failing venue does not stop the others. Returns an aggregate report
+    (venue counts, failures, totals and throughput, plus one result per venue
+    in input order), logs it, and saves it to report_json if given.
+    """
+    if (main_kwargs.get("workers") or 0) > 1:
+        raise ValueError("ERROR: build_venues runs venues in parallel; main()'s own workers must stay unset.")
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    results = [None] * len(venues)
+
+    if workers > 1 and len(venues) > 1:
+        with _process_pool(min(workers, len(venues)), mp_context) as pool:
+            futures = {pool.submit(_build_venue, venue, _venue_main_kwargs(venue, main_kwargs)): i
+                       for i, venue in enumerate(venues)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:  # the worker process itself died
+                    results[i] = {"venue": venues[i]["name"], "output_json": venues[i]["output_json"],
+                                  "ok": False, "error": f"{type(e).__name__}: {e}"}
+                logger.info("🏁 Venue '%s' %s", results[i]["venue"], "done" if results[i]["ok"] else "FAILED")
+    else:
+        for i, venue in enumerate(venues):
+            results[i] = _build_venue(venue, _venue_main_kwargs(venue, main_kwargs))
+
+    wall = time.perf_counter() - start
+    succeeded = [r for r in results if r["ok"]]
+    items = sum(r["items"] for r in succeeded)
+    report = {
+        "venues": len(venues),
+        "succeeded": len(succeeded),
+        "failed": len(venues) - len(succeeded),
+        "workers": workers,
+        "items": items,
+        "options": sum(r["options"] for r in succeeded),
+        "warnings": sum(r["warnings"] for r in succeeded),
+        "errors": sum(r["errors"] for r in succeeded),
+        "wall_s": round(wall, 3),
+        "items_per_s": round(items / wall, 1) if wall else None,
+        "results": results,
+    }
+    logger.info("📦 Batch summary: %d venues, %d succeeded, %d failed, %d items in %.1fs (%s items/s)",
+                report["venues"], report["succeeded"], report["failed"], report["items"],
+                report["wall_s"], report["items_per_s"])
+    for r in results:
+        if not r["ok"]:
+            logger.error("❌ %s: %s", r["venue"], r["error"])
+    if report_json:
+        with open(report_json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds catalog JSON from items/options/images CSV files.")
+    parser.add_argument("--batch", metavar="VENUES_DIR",
+                        help="build every venue subdirectory of VENUES_DIR (see discover_venues) instead of data/")
+    parser.add_argument("--output-dir", help="with --batch: write <venue>.json files here")
+    parser.add_argument("--workers", type=int, help="with --batch: venues built at the same time (default: CPUs)")
+    parser.add_argument("--report", help="with --batch: save the aggregate report here as JSON")
+    parser.add_argument("--validate-only", action="store_true",
+                        help="only check the CSVs in data/ (see validate_inputs), exit 1 if they have errors")
+    parser.add_argument("--validation-report", help="save the validation report here as JSON")
+    args = parser.parse_args()
+
+    # warnings and a final summary by default; use logging.DEBUG for per-category details
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.batch:
+        report = build_venues(discover_venues(args.batch, args.output_dir), workers=args.workers,
+                              report_json=args.report)
+        sys.exit(1 if report["failed"] else 0)
+
     base_dir = os.path.join(os.path.dirname(__file__), "data")
 
     items_csv = os.path.join(base_dir, "items.csv")
     options_csv = os.path.join(base_dir, "options.csv")
     images_csv = os.path.join(base_dir, "images.csv")
 
+    if args.validate_only:
+        report = validate_inputs(items_csv, options_csv, images_csv, report_json=args.validation_report)
+        sys.exit(0 if report["valid"] else 1)
+
     # You can change the venue name to customize the output filename
     venue = "demo_catalog"
     output_json = os.path.join(base_dir, f"{venue}.json")
 
     # final main() to generate the json
-    main(items_csv, options_csv, images_csv, output_json)
+    main(items_csv, options_csv, images_csv, output_json, validation_report=args.validation_report)
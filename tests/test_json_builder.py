@@ -0,0 +1,567 @@
+"""
+Tests for json-builder.py, run with either of
+
+    python -m unittest discover tests
+    python -m pytest tests
+
+Every test builds from small synthetic feeds written by benchmark.py's
+generators into a temporary directory.
+"""
+import copy
+import filecmp
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import tracemalloc
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+
+jb = benchmark.load_json_builder()
+logging.getLogger("json_builder").setLevel(logging.CRITICAL)
+
+class FeedTestCase(unittest.TestCase):
+    """Writes one synthetic items/options/images feed for the whole class."""
+
+    rows = 300
+
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls.tmp = cls._tmp.name
+        cls.items_csv = os.path.join(cls.tmp, "items.csv")
+        cls.options_csv = os.path.join(cls.tmp, "options.csv")
+        cls.images_csv = os.path.join(cls.tmp, "images.csv")
+        benchmark.generate_items_csv(cls.items_csv, cls.rows, categories=5, subcats=2)
+        benchmark.generate_options_csv(cls.options_csv, cls.rows)
+        benchmark.generate_images_csv(cls.images_csv, cls.rows)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def build(self, name, **kwargs):
+        output_json = self.path(name)
+        jb.main(self.items_csv, self.options_csv, self.images_csv, output_json, **kwargs)
+        return output_json
+
+    def assertSameFile(self, a, b):
+        self.assertTrue(filecmp.cmp(a, b, shallow=False), f"{a} and {b} differ")
+
+def random_ids(count, seed=0):
+    generator = jb.IdGenerator(seed=seed, tracking="none")
+    return [generator() for _ in range(count)]
+
+class CompactIdSetTest(unittest.TestCase):
+
+    def test_add_and_contains(self):
+        ids = random_ids(1000)
+        id_set = jb.CompactIdSet(capacity=16)
+        for new_id in ids:
+            self.assertTrue(id_set.add(new_id))
+        for new_id in ids:
+            self.assertIn(new_id, id_set)
+            self.assertFalse(id_set.add(new_id))
+        self.assertEqual(len(id_set), len(ids))
+        for other in random_ids(1000, seed=1):
+            self.assertNotIn(other, id_set)
+
+    def test_grow_keeps_ids_and_memory_bound(self):
+        id_set = jb.CompactIdSet(capacity=16)
+        ids = random_ids(100000)
+        for count, new_id in enumerate(ids, start=1):
+            id_set.add(new_id)
+            if count % 10000 == 0:
+                # 12 bytes per slot, never below MAX_LOAD / 2 after a grow
+                self.assertLessEqual(id_set.memory_bytes() / count, 12 / (jb.CompactIdSet._MAX_LOAD / 2) + 1)
+        self.assertEqual(len(id_set), len(ids))
+        self.assertTrue(all(new_id in id_set for new_id in ids))
+
+class IdTrackingMemoryTest(unittest.TestCase):
+
+    def traced_bytes(self, tracking, count=50000):
+        tracemalloc.start()
+        try:
+            generator = jb.IdGenerator(seed=1, tracking=tracking)
+            for _ in range(count):
+                generator()
+            generator._pool = iter(())  # leave out the unused pool
+            return tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+
+    def test_compact_uses_less_memory_than_set(self):
+        set_bytes = self.traced_bytes("set")
+        compact_bytes = self.traced_bytes("compact")
+        none_bytes = self.traced_bytes("none")
+        self.assertLess(compact_bytes * 3, set_bytes)
+        self.assertLess(none_bytes, compact_bytes)
+        self.assertLess(compact_bytes / 50000, 40)
+
+    def test_tracking_modes_issue_the_same_ids(self):
+        ids = {}
+        for tracking in jb.ID_TRACKING_MODES:
+            generator = jb.IdGenerator(seed=7, tracking=tracking)
+            ids[tracking] = [generator() for _ in range(5000)]
+        self.assertEqual(ids["compact"], ids["set"])
+        self.assertEqual(ids["compact"], ids["none"])
+
+class StreamingWriterTest(FeedTestCase):
+
+    def test_stream_matches_dump(self):
+        dumped = self.build("dump.json", id_seed=1)
+        streamed = self.build("stream.json", id_seed=1, stream=True)
+        self.assertSameFile(dumped, streamed)
+
+class DocTemplatesTest(FeedTestCase):
+
+    def test_templates_hold_only_immutable_values(self):
+        for template in (jb._ITEM_TEMPLATE, jb._OPTION_TEMPLATE, jb._OPTION_VALUE_TEMPLATE,
+                         jb._MAIN_CATEGORY_TEMPLATE, jb._SUB_CATEGORY_TEMPLATE, jb._MISC_CATEGORY_TEMPLATE):
+            for key, value in template.items():
+                self.assertIsInstance(value, (type(None), str, int, tuple), key)
+
+    def test_mutating_one_item_leaves_the_others_alone(self):
+        items_table = jb.read_items_csv(self.items_csv)
+        cata_obj, cat_map = jb.cats_gen(self.items_csv, items_table)
+        options, sku_to_options = jb.opts_gen(self.options_csv, cata_obj["$oid"]["_id"])
+        items = jb.iter_items(self.items_csv, cata_obj["$oid"]["_id"], sku_to_options, cat_map, {}, items_table)
+        first, second = [item for item in items if item["options"]][:2]
+        expected = copy.deepcopy(second)
+        first["v"]["author"]["id"] = "changed"
+        first["v"]["created_at"]["$date"] = 0
+        first["enabled"]["enabled"] = not first["enabled"]["enabled"]
+        first["cata_id"]["_id"] = "changed"
+        first["options"][0]["option_id"]["_id"] = "changed"
+        self.assertEqual(second, expected)
+        self.assertEqual(jb._AUTHOR["id"], expected["v"]["author"]["id"])
+        self.assertIn(second["options"][0]["option_id"]["_id"], {option["$oid"]["_id"] for option in options})
+        jb.clear_localized_cache()
+
+class SpawnWorkersTest(FeedTestCase):
+    """Worker pools must not depend on fork copying the loaded module."""
+
+    def test_parallel_items_with_spawn(self):
+        items_table = jb.read_items_csv(self.items_csv)
+        cata_obj, cat_map = jb.cats_gen(self.items_csv, items_table)
+        _, sku_to_options = jb.opts_gen(self.options_csv, cata_obj["$oid"]["_id"])
+        builds = [list(jb.iter_items_parallel(self.items_csv, cata_obj["$oid"]["_id"], sku_to_options, cat_map, {},
+                                              items_table, workers=2, chunk_rows=100, id_seed=1,
+                                              mp_context=multiprocessing.get_context(method)))
+                  for method in ("fork", "spawn")]
+        self.assertEqual(len(builds[1]), self.rows)
+        self.assertEqual(builds[0], builds[1])
+        jb.clear_localized_cache()
+
+    def test_build_venues_with_spawn(self):
+        venues_dir = self.path("spawn_venues")
+        for name in ("east", "west"):
+            os.makedirs(os.path.join(venues_dir, name))
+            for csv_path in (self.items_csv, self.options_csv, self.images_csv):
+                shutil.copy(csv_path, os.path.join(venues_dir, name))
+        venues = jb.discover_venues(venues_dir)
+        report = jb.build_venues(venues, workers=2, mp_context=multiprocessing.get_context("spawn"), id_mode="hash")
+        self.assertEqual(report["failed"], 0)
+        for venue in venues:
+            self.assertTrue(os.path.getsize(venue["output_json"]))
+
+class BuildSummaryTest(FeedTestCase):
+    """The logger is at CRITICAL in these tests: the counts must not depend on it."""
+
+    def test_counts_do_not_depend_on_the_log_level(self):
+        bad_options_csv = self.path("bad_options.csv")
+        bad_images_csv = self.path("bad_images.csv")
+        shutil.copy(self.options_csv, bad_options_csv)
+        shutil.copy(self.images_csv, bad_images_csv)
+        with open(bad_options_csv, "a", encoding="utf-8") as f:
+            f.write(",,S,,\nSKU1,,,,\n")  # no merchant_sku, no opt_name
+        with open(bad_images_csv, "a", encoding="utf-8") as f:
+            f.writelines(f"SKU0,https://img.example.com/0/extra-{k}.jpg\n" for k in range(4))  # 6 images
+        for workers in (None, 2):
+            clean = jb.main(self.items_csv, self.options_csv, self.images_csv, self.path("clean.json"),
+                            id_seed=1, workers=workers)
+            stats = jb.main(self.items_csv, bad_options_csv, bad_images_csv, self.path("summary.json"),
+                            id_seed=1, workers=workers)
+            self.assertEqual(stats["warnings"] - clean["warnings"], 2)
+            self.assertEqual(stats["errors"] - clean["errors"], 1)
+
+class BuildIdScopeTest(FeedTestCase):
+
+    def test_main_restores_the_previous_generator(self):
+        generator = jb.IdGenerator(seed=3)
+        previous = jb.set_id_generator(generator)
+        try:
+            self.build("scope.json", id_seed=1)
+            self.assertIs(jb.set_id_generator(generator), generator)
+            self.assertEqual(len(generator.generated_ids), 0)
+        finally:
+            jb.set_id_generator(previous)
+
+class HashIdTest(FeedTestCase):
+
+    def test_hash_mode_matches_parallel_build(self):
+        serial = self.build("hash.json", id_mode="hash", id_namespace="feed")
+        parallel = self.build("hash_parallel.json", id_mode="hash", id_namespace="feed", workers=2)
+        self.assertSameFile(serial, parallel)
+
+    def test_catalogs_do_not_share_hashed_ids(self):
+        def ids(output_json):
+            with open(output_json, encoding="utf-8") as f:
+                build = jb.json.load(f)
+            return {build["catalog"]["$oid"]["_id"]} | {cat["id"]["_id"] for cat in build["catalog"]["categories"]}
+        # the namespace defaults to the catalog (output file) name
+        north = ids(self.build("north.json", id_mode="hash"))
+        south = ids(self.build("south.json", id_mode="hash"))
+        self.assertFalse(north & south)
+        self.assertEqual(north, ids(self.build("north.json", id_mode="hash", id_namespace="north")))
+
+    def test_only_repeating_keys_are_counted(self):
+        generator = jb.HashIdGenerator("feed")
+        item_ids = [generator(("item", f"SKU{i}")) for i in range(1000)]
+        self.assertEqual(len(set(item_ids)), 1000)
+        self.assertEqual(len(generator._occurrences), 0)
+        # two values of one option group named alike still get distinct IDs
+        key = ("option_value", "SKU1", "Size", "M")
+        self.assertNotEqual(generator(key), generator(key))
+        self.assertNotEqual(generator(), generator())
+
+    def test_hash_mode_with_fresh_manifest_matches_hash_mode(self):
+        plain = self.build("hash_plain.json", id_mode="hash", id_namespace="feed")
+        with_manifest = self.build("hash_manifest.json", id_mode="hash", id_namespace="feed",
+                                   manifest_path=self.path("fresh.manifest"))
+        self.assertSameFile(plain, with_manifest)
+        # and the manifest's IDs are reused as is on the next build
+        rebuilt = self.build("hash_rebuilt.json", id_mode="hash", id_namespace="feed",
+                             manifest_path=self.path("fresh.manifest"))
+        self.assertSameFile(plain, rebuilt)
+
+class JsonStreamTest(unittest.TestCase):
+
+    def test_reads_values_across_chunk_boundaries(self):
+        doc = {"items": [{"a": "x" * 50, "n": i, "s": "α\"}"} for i in range(200)],
+               "catalog": {"k": [1, 2.5, None, True]}, "options": []}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "doc.json")
+            with open(path, "w", encoding="utf-8") as f:
+                jb.json.dump(doc, f, ensure_ascii=False, indent=2)
+            read_chunk, jb._READ_CHUNK_CHARS = jb._READ_CHUNK_CHARS, 64
+            try:
+                events = list(jb.iter_top_level(path, "builtin"))
+            finally:
+                jb._READ_CHUNK_CHARS = read_chunk
+        members = [event for event in events if event[0] == "member"]
+        self.assertEqual([event[2] for event in members], doc["items"])
+        values = {event[1]: event[2] for event in events if event[0] == "value"}
+        self.assertEqual(values["catalog"], doc["catalog"])
+
+class DiffBuildsTest(FeedTestCase):
+
+    def test_diff_of_identical_builds_is_empty(self):
+        first = self.build("first.json", id_mode="hash", id_namespace="feed")
+        second = self.build("second.json", id_mode="hash", id_namespace="feed")
+        counts = jb.diff_builds(first, second, self.path("patch.ndjson"))
+        self.assertEqual(counts["add"] + counts["change"] + counts["remove"], 0)
+        self.assertGreater(counts["unchanged"], self.rows)
+        self.assertEqual(os.path.getsize(self.path("patch.ndjson")), 0)
+
+    def test_diff_reports_changed_items(self):
+        first = self.build("base.json", id_mode="hash", id_namespace="feed")
+        items = jb.json.load(open(first, encoding="utf-8"))
+        items["items"][0]["baseprice"] += 1
+        del items["items"][1]
+        changed = self.path("changed.json")
+        with open(changed, "w", encoding="utf-8") as f:
+            jb.json.dump(items, f, ensure_ascii=False, indent=2)
+        counts = jb.diff_builds(first, changed, self.path("changed.patch.ndjson"))
+        self.assertEqual((counts["add"], counts["change"], counts["remove"]), (0, 1, 1))
+
+class StripImagesTest(FeedTestCase):
+
+    def test_streamed_strip_matches_load(self):
+        built = self.build("images.json", id_seed=1)
+        jb.remove_images_in_json_file(built, self.path("strip_load.json"), stream=False)
+        jb.remove_images_in_json_file(built, self.path("strip_stream.json"), stream=True)
+        self.assertSameFile(self.path("strip_load.json"), self.path("strip_stream.json"))
+
+    def test_any_layout_is_stripped(self):
+        docs = {
+            "list.json": [{"image": "a.png", "images": ["a.png"]}, {"nested": {"image_blur": "x"}}],
+            "other.json": {"venue": {"image": "a.png"}, "options": [{"values": [{"image": "b.png"}]}], "n": 1},
+        }
+        for name, doc in docs.items():
+            with open(self.path(name), "w", encoding="utf-8") as f:
+                jb.json.dump(doc, f)
+            for stream in (False, True):
+                cleaned_path = self.path(f"{stream}_{name}")
+                jb.remove_images_in_json_file(self.path(name), cleaned_path, stream=stream)
+                with open(cleaned_path, encoding="utf-8") as f:
+                    self.assertEqual(jb.json.load(f), jb.strip_images(jb.json.loads(jb.json.dumps(doc))))
+            self.assertSameFile(self.path(f"False_{name}"), self.path(f"True_{name}"))
+
+class LocalizedCacheTest(FeedTestCase):
+
+    def test_items_do_not_grow_the_cache(self):
+        jb.clear_localized_cache()
+        items_table = jb.read_items_csv(self.items_csv)
+        cata_obj, cat_map = jb.cats_gen(self.items_csv, items_table)
+        _, sku_to_options = jb.opts_gen(self.options_csv, cata_obj["$oid"]["_id"])
+        before = len(jb._localized_cache)
+        items = list(jb.iter_items(self.items_csv, cata_obj["$oid"]["_id"], sku_to_options, cat_map, {},
+                                   items_table))
+        self.assertLessEqual(len(jb._localized_cache), before + 1)  # the shared empty description
+        self.assertTrue(any(item["description"][0]["value"] for item in items))
+        jb.clear_localized_cache()
+
+    def test_main_clears_the_cache(self):
+        self.build("cache.json", id_seed=1, output_format="ndjson")
+        self.assertEqual(len(jb._localized_cache), 0)
+        self.assertEqual(len(jb._item_text_cache), 0)
+
+    def items(self):
+        items_table = jb.read_items_csv(self.items_csv)
+        cata_obj, cat_map = jb.cats_gen(self.items_csv, items_table)
+        _, sku_to_options = jb.opts_gen(self.options_csv, cata_obj["$oid"]["_id"])
+        return list(jb.iter_items(self.items_csv, cata_obj["$oid"]["_id"], sku_to_options, cat_map, {},
+                                  items_table))
+
+    def test_same_item_text_shares_one_object(self):
+        jb.clear_localized_cache()
+        shared = {}
+        for item in self.items():
+            for field in ("description", "more_information", "producer_information"):
+                if item[field]:
+                    text = item[field][0]["value"]
+                    self.assertIs(shared.setdefault((field, text), item[field]), item[field])
+        self.assertLess(len(shared), self.rows)
+        jb.clear_localized_cache()
+
+    def test_item_text_cache_is_bounded(self):
+        jb.clear_localized_cache()
+        expected = [item["description"] for item in self.items()]
+        jb.clear_localized_cache()
+        size = jb.ITEM_TEXT_CACHE_SIZE
+        jb.ITEM_TEXT_CACHE_SIZE = 10
+        try:
+            items = self.items()
+        finally:
+            jb.ITEM_TEXT_CACHE_SIZE = size
+        self.assertEqual(len(jb._item_text_cache), 10)
+        self.assertEqual([item["description"] for item in items], expected)
+        jb.clear_localized_cache()
+
+class LocalizedColumnsTest(FeedTestCase):
+
+    def test_column_detection(self):
+        header = ["merchant_sku", "name", "name_en", "name_el", "name_id", "name_id-ID", "name_pt-BR", "name_english",
+                  "description_de", "brand_id", "opt_name_fr"]
+        self.assertEqual(jb.localized_columns(header, ("name", "description")), {
+            "name": (("en", "name_en"), ("id-ID", "name_id-ID"), ("pt-BR", "name_pt-BR")),
+            "description": (("de", "description_de"),),
+        })
+        self.assertEqual(jb.localized_columns(["name", "price"], ("name",)), {})
+
+    def test_empty_primary_value(self):
+        self.assertEqual(jb._new_localized("", (("en", "Text"),)), [{"lang": "en", "value": "Text", "verified": True}])
+        self.assertEqual(jb._new_localized(""), [{"lang": "el", "value": "", "verified": True}])
+
+    def load_build(self, items_csv, options_csv):
+        output_json = self.path("localized.json")
+        jb.main(items_csv, options_csv, self.images_csv, output_json, id_seed=1)
+        with open(output_json, encoding="utf-8") as f:
+            return jb.json.load(f)
+
+    def test_category_and_option_translations(self):
+        items_csv = self.path("ml_items.csv")
+        options_csv = self.path("ml_options.csv")
+        with open(items_csv, "w", encoding="utf-8") as f:
+            f.write("merchant_sku,name,price,cat_name,sub_cat,description,cat_name_en,sub_cat_en,description_en\n"
+                    "SKU0,Καφές,2.50,Ποτά,Ζεστά,,Drinks,Hot,Coffee\n"
+                    "SKU1,Τσάι,2.00,Ποτά,Ζεστά,,,,\n")
+        with open(options_csv, "w", encoding="utf-8") as f:
+            f.write("merchant_sku,dis_name,opt_name,dis_name_en,opt_name_en\n"
+                    "SKU0,Μέγεθος,Μικρό,Size,Small\n"
+                    "SKU0,Μέγεθος,Μεγάλο,Size,\n")
+        build = self.load_build(items_csv, options_csv)
+
+        def texts(localized):
+            return [(entry["lang"], entry["value"]) for entry in localized]
+
+        names = [texts(category["name"]) for category in build["catalog"]["categories"]]
+        self.assertEqual(names, [[("el", "Ποτά"), ("en", "Drinks")], [("el", "Ζεστά"), ("en", "Hot")]])
+        option, = build["options"]
+        self.assertEqual(texts(option["name"]), [("el", "Μέγεθος"), ("en", "Size")])
+        self.assertEqual([texts(value["name"]) for value in option["values"]],
+                         [[("el", "Μικρό"), ("en", "Small")], [("el", "Μεγάλο")]])
+        self.assertEqual([texts(item["description"]) for item in build["items"]], [[("en", "Coffee")], [("el", "")]])
+
+    def test_feed_without_language_columns(self):
+        build = self.load_build(self.items_csv, self.options_csv)
+        localized = [category["name"] for category in build["catalog"]["categories"]]
+        localized += [option["name"] for option in build["options"]]
+        localized += [value["name"] for option in build["options"] for value in option["values"]]
+        localized += [item[field] for item in build["items"]
+                      for field in ("name", "description", "more_information", "producer_information") if item[field]]
+        self.assertEqual({entry["lang"] for texts in localized for entry in texts}, {"el"})
+        self.assertTrue(all(len(texts) == 1 for texts in localized))
+
+class BuildVenuesTest(FeedTestCase):
+
+    def test_venues_never_share_hashed_ids(self):
+        venues_dir = self.path("venues")
+        for name in ("north", "south"):
+            os.makedirs(os.path.join(venues_dir, name))
+            for csv_path in (self.items_csv, self.options_csv, self.images_csv):
+                shutil.copy(csv_path, os.path.join(venues_dir, name))
+        venues = jb.discover_venues(venues_dir)
+        for namespace in ("", "prod"):
+            report = jb.build_venues(venues, workers=1, id_mode="hash", id_namespace=namespace)
+            self.assertEqual(report["failed"], 0)
+            catalog_ids = set()
+            for venue in venues:
+                with open(venue["output_json"], encoding="utf-8") as f:
+                    catalog_ids.add(jb.json.load(f)["catalog"]["$oid"]["_id"])
+            self.assertEqual(len(catalog_ids), len(venues))
+
+    def test_venues_missing_inputs_fail(self):
+        venues_dir = self.path("partial_venues")
+        for name, inputs in (("full", (self.items_csv, self.options_csv, self.images_csv)),
+                             ("partial", (self.items_csv,)), ("empty", ())):
+            os.makedirs(os.path.join(venues_dir, name))
+            for csv_path in inputs:
+                shutil.copy(csv_path, os.path.join(venues_dir, name))
+        venues = jb.discover_venues(venues_dir)
+        self.assertEqual([venue["name"] for venue in venues], ["full", "partial"])
+        self.assertEqual(venues[1]["missing"], ["options.csv", "images.csv"])
+        report = jb.build_venues(venues, workers=1)
+        self.assertEqual((report["succeeded"], report["failed"]), (1, 1))
+        self.assertEqual(report["results"][1]["error"], "missing options.csv, images.csv")
+
+class ItemOptionLinksTest(FeedTestCase):
+
+    def test_every_option_group_is_linked_in_file_order(self):
+        options_csv = self.path("two_groups.csv")
+        with open(options_csv, "w", encoding="utf-8") as f:
+            f.write("merchant_sku,dis_name,opt_name\n"
+                    "SKU0,Μέγεθος,S\n"
+                    "SKU0,Χρώμα,Κόκκινο\n"
+                    "SKU0,Μέγεθος,M\n"
+                    "SKU0,Χρώμα,Μπλε\n")
+        output_json = self.path("two_groups.json")
+        jb.main(self.items_csv, options_csv, self.images_csv, output_json, id_seed=1)
+        with open(output_json, encoding="utf-8") as f:
+            build = jb.json.load(f)
+        option_ids = [option["$oid"]["_id"] for option in build["options"]]
+        self.assertEqual([option["name"][0]["value"] for option in build["options"]], ["Μέγεθος", "Χρώμα"])
+        item = next(item for item in build["items"] if item["merchant_sku"] == "SKU0")
+        self.assertEqual([reference["option_id"]["_id"] for reference in item["options"]], option_ids)
+        self.assertEqual(len({reference["id"]["_id"] for reference in item["options"]}), 2)
+        self.assertFalse(any(item["options"] for item in build["items"] if item["merchant_sku"] != "SKU0"))
+
+class DedupOptionsTest(FeedTestCase):
+
+    def build_options(self, rows):
+        options_csv = self.path("dedup_options.csv")
+        with open(options_csv, "w", encoding="utf-8") as f:
+            f.write("merchant_sku,dis_name,opt_name,price_markup,ext_id\n")
+            f.writelines(",".join(row) + "\n" for row in rows)
+        output_json = self.path("dedup.json")
+        jb.main(self.items_csv, options_csv, self.images_csv, output_json, id_seed=1, dedup_options=True)
+        with open(output_json, encoding="utf-8") as f:
+            build = jb.json.load(f)
+        links = {item["merchant_sku"]: [reference["option_id"]["_id"] for reference in item["options"]]
+                 for item in build["items"] if item["options"]}
+        return build["options"], links
+
+    def test_identical_groups_share_one_doc(self):
+        options, links = self.build_options([
+            (sku, "Μέγεθος", size, markup, "")
+            for sku in ("SKU0", "SKU1", "SKU2") for size, markup in (("S", ""), ("M", "50"))
+        ])
+        option, = options
+        self.assertEqual(links, {sku: [option["$oid"]["_id"]] for sku in ("SKU0", "SKU1", "SKU2")})
+
+    def test_different_markups_or_ext_ids_do_not(self):
+        options, links = self.build_options([
+            ("SKU0", "Μέγεθος", "S", "50", "e1"),
+            ("SKU1", "Μέγεθος", "S", "0", "e1"),
+            ("SKU2", "Μέγεθος", "S", "50", "e2"),
+            ("SKU3", "Μέγεθος", "S", "50", "e1"),
+        ])
+        self.assertEqual(len(options), 3)
+        self.assertEqual(links["SKU0"], links["SKU3"])
+        self.assertEqual(len({links[sku][0] for sku in ("SKU0", "SKU1", "SKU2")}), 3)
+        self.assertEqual({option["$oid"]["_id"] for option in options}, {ids[0] for ids in links.values()})
+
+class PricesToCentsTest(unittest.TestCase):
+
+    def test_numpy_and_python_agree(self):
+        if jb.np is None:
+            self.skipTest("NumPy is not installed")
+        rng = random.Random(3)
+        prices = [f"{rng.uniform(0, 500):.{rng.randrange(4)}f}" for _ in range(20000)]
+        prices += ["0.005", "0.015", "2.675", "1e2", "-0", "1_000"]
+        with_numpy = jb.prices_to_cents(prices)
+        np, jb.np = jb.np, None
+        try:
+            without_numpy = jb.prices_to_cents(prices)
+        finally:
+            jb.np = np
+        self.assertEqual(with_numpy, without_numpy)
+        self.assertTrue(all(type(cents) is int for cents in with_numpy[0]))
+
+    def test_bad_prices(self):
+        cents, bad = jb.prices_to_cents(["1.5", "abc", "nan", "", "inf", "2"])
+        self.assertEqual(bad, [1, 2, 3, 4])
+        self.assertEqual((cents[0], cents[5]), (150, 200))
+
+class ValidationTest(FeedTestCase):
+
+    def write_bad_items(self):
+        bad_items = self.path("bad_items.csv")
+        with open(self.items_csv, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        header = lines[0].split(",")
+        price = header.index("price")
+        for row_index, value in ((3, "abc"), (10, ""), (20, "nan")):
+            cells = lines[row_index].split(",")
+            cells[price] = value
+            lines[row_index] = ",".join(cells)
+        with open(bad_items, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return bad_items
+
+    def test_reports_every_bad_row(self):
+        bad_items = self.write_bad_items()
+        report = jb.validate_inputs(bad_items, self.options_csv, self.images_csv)
+        self.assertFalse(report["valid"])
+        self.assertEqual([error["row"] for error in report["files"]["items"]["errors"]], [3, 10, 20])
+        # the loaded table gives the same report without reading items.csv again
+        table = jb.read_items_csv(bad_items, raise_errors=False)
+        from_table = jb.validate_inputs(bad_items, self.options_csv, self.images_csv, items_table=table)
+        self.assertEqual(from_table, report)
+
+    def test_main_skips_invalid_builds(self):
+        output_json = self.path("invalid.json")
+        with self.assertRaises(ValueError):
+            jb.main(self.write_bad_items(), self.options_csv, self.images_csv, output_json)
+        self.assertFalse(os.path.exists(output_json))
+
+class BuildProfileTest(FeedTestCase):
+
+    def test_failed_build_stops_memory_tracing(self):
+        with self.assertRaises(OSError):
+            jb.main(self.items_csv, self.path("missing_options.csv"), self.images_csv, self.path("failed.json"),
+                    profile=True, validate=False)
+        self.assertFalse(tracemalloc.is_tracing())
+
+if __name__ == "__main__":
+    unittest.main()